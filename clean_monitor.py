@@ -1,10 +1,14 @@
 import asyncio
+import hashlib
 import logging
 import os
 import sys
 import signal
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Set, Tuple
 import tempfile
 
 from telethon import TelegramClient
@@ -17,7 +21,6 @@ from telethon.errors import (
     ChannelPrivateError
 )
 
-import aiosqlite
 import config
 
 logger = config.logger
@@ -32,63 +35,170 @@ class CleanFileMonitor:
             api_hash=config.API_HASH
         )
         
-        self.source_channels = config.SOURCE_CHANNELS
-        self.destination_channel = config.DESTINATION_CHANNEL
-        self.target_extension = config.TARGET_EXTENSION
-        self.messages_to_check = config.MESSAGES_TO_CHECK
-        self.check_interval = config.CHECK_INTERVAL
-        
-        self.db_conn: Optional[aiosqlite.Connection] = None
+        # اتصال sqlite3 فقط از یک ترد اختصاصی استفاده می‌شود
+        self.db_conn: Optional[sqlite3.Connection] = None
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='clean_db')
+        self._pending_rows: List[tuple] = []
         self.is_running = True
+        self._stop_event = asyncio.Event()
+        
+        # کش شناسه فایل‌های پردازش شده برای جلوگیری از کوئری در هر پیام
+        self._processed_ids: Set[int] = set()
+        # هش محتوای فایل‌ها برای تشخیص فایل تکراری که دوباره آپلود شده
+        self._content_hashes: Set[int] = set()
+        # شناسه فایل‌هایی که در حال دانلود/ارسال هستند
+        self._in_flight: Set[int] = set()
+        
+        # موجودیت‌های کانال که یک بار در شروع دریافت می‌شوند
+        self._entities: Dict[str, Channel] = {}
+        self._dest_entity: Optional[Channel] = None
         
-        # آیدی کانال مقصد برای نمایش در کپشن
-        self.destination_id = config.DESTINATION_CHANNEL.replace('@', '')
+        # ارسال‌ها از یک دروازه مشترک عبور می‌کنند؛ FloodWait همه را متوقف می‌کند
+        self._send_gate = asyncio.Semaphore(1)
+        self._next_ok_at = 0.0  # زمان (monotonic) مجاز برای ارسال بعدی
+        self._last_send_at = 0.0
+        self._min_send_gap = 0.0  # پس از اولین FloodWait فعال می‌شود
+        
+        # قالب کپشن یک بار ساخته می‌شود؛ تاریخ در شروع هر سیکل تنظیم می‌شود
+        self._caption_tmpl = (
+            f"📁 **{{name}}**\n\n"
+            f"🆔 **کانال:** @{config.DESTINATION_ID}\n"
+            f"📅 **تاریخ:** {{ts}}\n\n"
+            f"#فایل #کانال"
+        )
+        self._cycle_ts = ''
         
         logger.info("🧼 ربات کپی تمیز فایل‌ها راه‌اندازی شد")
     
-    async def init_database(self):
-        """راه‌اندازی دیتابیس"""
-        self.db_conn = await aiosqlite.connect('clean_messages.db')
+    async def _run_db(self, func, *args):
+        """اجرای یک تابع دیتابیس در ترد اختصاصی SQLite"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._db_executor, func, *args)
+    
+    async def _fetchall(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """اجرای کوئری خواندنی در یک رفت‌وبرگشت"""
+        return await self._run_db(lambda: self.db_conn.execute(sql, params).fetchall())
+    
+    def _init_database_sync(self) -> List[tuple]:
+        """ساخت جدول‌ها و بارگذاری رکوردها (در ترد دیتابیس)"""
+        # isolation_level=None: تراکنش‌ها فقط با BEGIN/COMMIT صریح
+        self.db_conn = sqlite3.connect(
+            'clean_messages.db',
+            check_same_thread=False,
+            isolation_level=None
+        )
+        conn = self.db_conn
+        
+        # WAL و synchronous=NORMAL تا commit هر سیکل فقط یک append باشد
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-65536')
         
-        await self.db_conn.execute('''
+        conn.execute('BEGIN')
+        
+        # جدول قدیمی با کلید متنی file_hash («id_size») تغییر نام داده می‌شود
+        columns = conn.execute('PRAGMA table_info(processed_files)').fetchall()
+        legacy_table = any(column[1] == 'file_hash' for column in columns)
+        if legacy_table:
+            conn.execute('ALTER TABLE processed_files RENAME TO processed_files_legacy')
+        
+        conn.execute('''
             CREATE TABLE IF NOT EXISTS processed_files (
-                file_hash TEXT PRIMARY KEY,
+                file_id INTEGER PRIMARY KEY,
                 original_message_id INTEGER,
                 channel_id INTEGER,
                 file_name TEXT,
+                content_hash INTEGER,
                 processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
         
-        await self.db_conn.commit()
-        logger.info("✅ دیتابیس راه‌اندازی شد")
+        # افزودن ستون هش محتوا به جدول‌های قدیمی‌تر
+        columns = conn.execute('PRAGMA table_info(processed_files)').fetchall()
+        if not any(column[1] == 'content_hash' for column in columns):
+            conn.execute('ALTER TABLE processed_files ADD COLUMN content_hash INTEGER')
+        
+        # ایندکس برای آخرین فایل‌ها در آمار
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_processed_at 
+            ON processed_files(processed_at DESC)
+        ''')
+        
+        # انتقال رکوردهای قدیمی به کلید عددی
+        if legacy_table:
+            conn.execute('''
+                INSERT OR IGNORE INTO processed_files 
+                (file_id, original_message_id, channel_id, file_name, processed_at)
+                SELECT CAST(substr(file_hash, 1, instr(file_hash, '_') - 1) AS INTEGER),
+                       original_message_id, channel_id, file_name, processed_at
+                FROM processed_files_legacy
+            ''')
+            conn.execute('DROP TABLE processed_files_legacy')
+            logger.info("🔁 جدول processed_files به کلید عددی منتقل شد")
+        
+        conn.execute('COMMIT')
+        
+        return conn.execute('SELECT file_id, content_hash FROM processed_files').fetchall()
     
-    def get_file_hash(self, document: Document) -> str:
-        """ایجاد هش یکتا برای فایل"""
-        file_id = str(document.id)
-        file_size = str(document.size)
-        return f"{file_id}_{file_size}"
+    async def init_database(self):
+        """راه‌اندازی دیتابیس"""
+        # کل راه‌اندازی در یک رفت‌وبرگشت به ترد دیتابیس
+        rows = await self._run_db(self._init_database_sync)
+        
+        # بارگذاری یکباره شناسه‌های موجود در حافظه
+        self._processed_ids = {row[0] for row in rows}
+        self._content_hashes = {row[1] for row in rows if row[1] is not None}
+        
+        logger.info(f"✅ دیتابیس راه‌اندازی شد ({len(self._processed_ids)} فایل ثبت شده)")
     
-    async def is_file_processed(self, file_hash: str) -> bool:
+    def get_file_hash(self, document: Document) -> int:
+        """کلید یکتای فایل (شناسه داکیومنت تلگرام)"""
+        return document.id
+    
+    async def is_file_processed(self, file_id: int) -> bool:
         """بررسی آیا فایل قبلاً پردازش شده است"""
-        cursor = await self.db_conn.execute(
-            'SELECT 1 FROM processed_files WHERE file_hash = ?',
-            (file_hash,)
+        # همه نوشتن‌ها از mark_file_as_processed عبور می‌کنند، پس کش کامل است
+        return file_id in self._processed_ids
+    
+    def mark_file_as_processed(self, file_id: int, message_id: int, 
+                               channel_id: int, filename: str,
+                               content_hash: Optional[int] = None):
+        """علامت‌گذاری فایل به عنوان پردازش شده (ذخیره در flush_processed_files)"""
+        self._pending_rows.append(
+            (file_id, message_id, channel_id, filename, content_hash)
         )
-        result = await cursor.fetchone()
-        await cursor.close()
-        return result is not None
+        
+        self._processed_ids.add(file_id)
+        if content_hash is not None:
+            self._content_hashes.add(content_hash)
     
-    async def mark_file_as_processed(self, file_hash: str, message_id: int, 
-                                    channel_id: int, filename: str):
-        """علامت‌گذاری فایل به عنوان پردازش شده"""
-        await self.db_conn.execute('''
-            INSERT OR REPLACE INTO processed_files 
-            (file_hash, original_message_id, channel_id, file_name)
-            VALUES (?, ?, ?, ?)
-        ''', (file_hash, message_id, channel_id, filename))
-        
-        await self.db_conn.commit()
+    def _write_rows_sync(self, rows: List[tuple]):
+        """درج دسته‌ای رکوردها در یک تراکنش (در ترد دیتابیس)"""
+        self.db_conn.execute('BEGIN')
+        try:
+            self.db_conn.executemany('''
+                INSERT OR REPLACE INTO processed_files 
+                (file_id, original_message_id, channel_id, file_name, content_hash)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+            self.db_conn.execute('COMMIT')
+        except Exception:
+            self.db_conn.execute('ROLLBACK')
+            raise
+    
+    async def flush_processed_files(self):
+        """ذخیره رکوردهای در انتظار با یک فراخوانی ترد دیتابیس"""
+        if not self._pending_rows or not self.db_conn:
+            return
+        
+        rows, self._pending_rows = self._pending_rows, []
+        try:
+            await self._run_db(self._write_rows_sync, rows)
+        except Exception:
+            # رکوردها برای تلاش بعدی نگه داشته می‌شوند
+            self._pending_rows[:0] = rows
+            raise
     
     async def authenticate(self):
         """احراز هویت کاربر"""
@@ -107,7 +217,8 @@ class CleanFileMonitor:
     async def check_destination_access(self):
         """بررسی دسترسی به کانال مقصد"""
         try:
-            dest_entity = await self.client.get_entity(self.destination_channel)
+            dest_entity = await self.client.get_entity(config.DESTINATION_CHANNEL)
+            self._dest_entity = dest_entity
             logger.info(f"🎯 کانال مقصد: {getattr(dest_entity, 'title', 'Unknown')}")
             
             # بررسی دسترسی ارسال
@@ -129,69 +240,109 @@ class CleanFileMonitor:
             logger.error(f"❌ خطا در دسترسی به کانال مقصد: {e}")
             return False
     
-    async def download_file(self, message: Message, filename: str) -> Optional[str]:
-        """دانلود فایل به صورت موقت"""
+    async def _resolve_entities(self):
+        """دریافت یکباره موجودیت کانال‌های مبدا"""
+        for channel_username in config.SOURCE_CHANNELS:
+            try:
+                self._entities[channel_username] = await self.client.get_entity(channel_username)
+            except Exception as e:
+                # در سیکل بعدی دوباره تلاش می‌شود
+                logger.warning(f"⚠️  کانال {channel_username} دریافت نشد: {e}")
+    
+    async def download_file(self, message: Message, filename: str) -> Optional[Tuple[str, int]]:
+        """دانلود فایل به صورت موقت و محاسبه هش محتوا در همان جریان"""
+        temp_file = None
         try:
-            # ایجاد فایل موقت
-            temp_dir = tempfile.gettempdir()
-            temp_file = os.path.join(temp_dir, f"telegram_{datetime.now().timestamp()}_{filename}")
+            hasher = hashlib.blake2b(digest_size=8)
             
-            # دانلود فایل
+            # ایجاد فایل موقت با نام یکتا و دانلود تکه‌تکه در آن
             logger.info(f"⬇️  در حال دانلود: {filename}")
-            downloaded = await self.client.download_media(
-                message.media,
-                file=temp_file
-            )
-            
-            if downloaded and os.path.exists(downloaded):
-                file_size = os.path.getsize(downloaded) / (1024 * 1024)  # به مگابایت
-                logger.info(f"✅ دانلود شد: {filename} ({file_size:.2f} MB)")
-                return downloaded
-            
-            return None
+            with tempfile.NamedTemporaryFile(
+                dir=tempfile.gettempdir(),
+                prefix='telegram_',
+                suffix=os.path.splitext(filename)[1],
+                delete=False
+            ) as tmp:
+                temp_file = tmp.name
+                async for chunk in self.client.iter_download(message.media.document):
+                    tmp.write(chunk)
+                    hasher.update(chunk)
+                downloaded_size = tmp.tell()
+            
+            # پایان iter_download یعنی دانلود موفق (فایل صفر بایتی هم ارسال می‌شود)
+            file_size = downloaded_size / (1024 * 1024)  # به مگابایت
+            logger.info(f"✅ دانلود شد: {filename} ({file_size:.2f} MB)")
+            # هش 64 بیتی به صورت عدد علامت‌دار تا در INTEGER دیتابیس جا شود
+            content_hash = int.from_bytes(hasher.digest(), 'big', signed=True)
+            return temp_file, content_hash
             
         except Exception as e:
             logger.error(f"❌ خطا در دانلود {filename}: {e}")
+            if temp_file:
+                self.remove_temp_file(temp_file)
             return None
     
+    def remove_temp_file(self, file_path: str):
+        """حذف فایل موقت"""
+        try:
+            os.unlink(file_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"⚠️  خطا در حذف فایل موقت {file_path}: {e}")
+    
     async def send_clean_file(self, file_path: str, filename: str, 
                              source_channel_name: str = "") -> bool:
         """ارسال فایل کپی شده بدون هیچ اثری از مبدا"""
         try:
-            # خواندن فایل
-            with open(file_path, 'rb') as f:
-                file_data = f.read()
-            
             # ایجاد کپشن
-            caption_lines = [
-                f"📁 **{filename}**",
-                "",
-                f"🆔 **کانال:** @{self.destination_id}",
-                f"📅 **تاریخ:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-                "",
-                "#فایل #کانال"
-            ]
-            
-            caption = "\n".join(caption_lines)
-            
-            # ارسال فایل
-            await self.client.send_file(
-                entity=self.destination_channel,
-                file=file_data,
-                caption=caption,
-                file_name=filename,
-                force_document=True,
-                silent=True,
-                allow_cache=False
-            )
-            
-            logger.info(f"📤 فایل ارسال شد: {filename}")
-            return True
-            
-        except FloodWaitError as e:
-            logger.warning(f"⏳ FloodWait: {e.seconds} ثانیه")
-            await asyncio.sleep(e.seconds)
-            return await self.send_clean_file(file_path, filename, source_channel_name)
+            caption = self._caption_tmpl.format(name=filename, ts=self._cycle_ts)
+            
+            # فایل فقط یک بار آپلود می‌شود و تلاش‌های بعدی از همان هندل استفاده می‌کنند
+            uploaded_file = None
+            
+            for attempt in range(1, config.MAX_SEND_RETRIES + 1):
+                async with self._send_gate:
+                    # فقط به درخواست سرور (FloodWait) صبر می‌کنیم
+                    delay = max(
+                        self._next_ok_at,
+                        self._last_send_at + self._min_send_gap
+                    ) - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    
+                    try:
+                        # آپلود مستقیم از مسیر تا Telethon آن را تکه‌تکه بخواند
+                        if uploaded_file is None:
+                            uploaded_file = await self.client.upload_file(
+                                file_path,
+                                file_name=filename
+                            )
+                        
+                        await self.client.send_file(
+                            entity=self._dest_entity or config.DESTINATION_CHANNEL,
+                            file=uploaded_file,
+                            caption=caption,
+                            file_name=filename,
+                            force_document=True,
+                            silent=True,
+                            attributes=[DocumentAttributeFilename(filename)]
+                        )
+                        
+                        self._last_send_at = time.monotonic()
+                        logger.info(f"📤 فایل ارسال شد: {filename}")
+                        return True
+                    
+                    except FloodWaitError as e:
+                        logger.warning(
+                            f"⏳ FloodWait: {e.seconds} ثانیه "
+                            f"(تلاش {attempt}/{config.MAX_SEND_RETRIES})"
+                        )
+                        self._next_ok_at = time.monotonic() + e.seconds
+                        self._min_send_gap = 0.1
+            
+            logger.error(f"❌ ارسال {filename} پس از {config.MAX_SEND_RETRIES} تلاش ناموفق بود")
+            return False
             
         except Exception as e:
             logger.error(f"❌ خطا در ارسال فایل: {e}")
@@ -206,55 +357,66 @@ class CleanFileMonitor:
             
             document = message.media.document
             
-            # استخراج نام فایل
-            filename = None
-            for attr in document.attributes:
-                if isinstance(attr, DocumentAttributeFilename):
-                    filename = attr.file_name
-                    break
+            # استخراج نام فایل (ویژگی‌های Telethon زیرکلاس ندارند؛ type به جای isinstance)
+            filename = next(
+                (attr.file_name for attr in document.attributes
+                 if type(attr) is DocumentAttributeFilename),
+                None
+            )
             
             if not filename:
                 return False
             
-            filename_lower = filename.lower()
-            
-            # بررسی پسوند مورد نظر
-            if not filename_lower.endswith(self.target_extension):
+            # بررسی پسوند مورد نظر (پسوند هدف در config با حروف کوچک است)
+            if not filename.lower().endswith(config.TARGET_EXTENSION):
                 return False
             
             # بررسی هش فایل
-            file_hash = self.get_file_hash(document)
-            if await self.is_file_processed(file_hash):
+            file_id = self.get_file_hash(document)
+            if await self.is_file_processed(file_id) or file_id in self._in_flight:
                 logger.info(f"⏭️  فایل قبلاً پردازش شده: {filename}")
                 return False
             
-            logger.info(f"🎯 فایل پیدا شد: {filename}")
-            
-            # دانلود فایل
-            downloaded_path = await self.download_file(message, filename)
-            if not downloaded_path:
-                return False
-            
-            # ارسال فایل کپی شده
-            success = await self.send_clean_file(downloaded_path, filename, 
-                                                getattr(channel, 'username', ''))
-            
-            # پاکسازی فایل موقت
+            # رزرو شناسه پیش از دانلود تا کانال‌های همزمان همان فایل را دوباره ارسال نکنند
+            self._in_flight.add(file_id)
             try:
-                if os.path.exists(downloaded_path):
-                    os.path.exists(downloaded_path)
-            except:
-                pass
-            
-            if success:
-                # ذخیره در دیتابیس
-                await self.mark_file_as_processed(
-                    file_hash, message.id, channel.id, filename
-                )
-                logger.info(f"✅ فایل پردازش شد: {filename}")
-                return True
-            
-            return False
+                logger.info(f"🎯 فایل پیدا شد: {filename}")
+                
+                # دانلود فایل
+                download_result = await self.download_file(message, filename)
+                if not download_result:
+                    return False
+                
+                downloaded_path, content_hash = download_result
+                
+                # فایل تکراری با شناسه جدید (آپلود مجدد همان محتوا)
+                if content_hash in self._content_hashes:
+                    logger.info(f"⏭️  محتوای تکراری: {filename}")
+                    self.remove_temp_file(downloaded_path)
+                    self.mark_file_as_processed(
+                        file_id, message.id, channel.id, filename, content_hash
+                    )
+                    return False
+                
+                # ارسال فایل کپی شده
+                try:
+                    success = await self.send_clean_file(downloaded_path, filename, 
+                                                        getattr(channel, 'username', ''))
+                finally:
+                    # پاکسازی فایل موقت
+                    self.remove_temp_file(downloaded_path)
+                
+                if success:
+                    # ذخیره در دیتابیس
+                    self.mark_file_as_processed(
+                        file_id, message.id, channel.id, filename, content_hash
+                    )
+                    logger.info(f"✅ فایل پردازش شد: {filename}")
+                    return True
+                
+                return False
+            finally:
+                self._in_flight.discard(file_id)
             
         except Exception as e:
             logger.error(f"❌ خطا در پردازش پیام: {e}")
@@ -265,25 +427,25 @@ class CleanFileMonitor:
         sent_count = 0
         
         try:
-            channel = await self.client.get_entity(channel_username)
+            channel = self._entities.get(channel_username)
+            if channel is None:
+                channel = await self.client.get_entity(channel_username)
+                self._entities[channel_username] = channel
             channel_title = getattr(channel, 'title', channel_username)
             logger.info(f"🔎 بررسی کانال: {channel_title}")
             
-            # دریافت آخرین پیام‌ها
-            messages = await self.client.get_messages(
+            # دریافت و پردازش جریانی آخرین پیام‌ها
+            message_count = 0
+            async for message in self.client.iter_messages(
                 channel,
-                limit=self.messages_to_check
-            )
-            
-            if not messages:
-                logger.info(f"📭 پیامی یافت نشد")
-                return 0
-            
-            # پردازش پیام‌ها
-            for message in messages:
+                limit=config.MESSAGES_TO_CHECK
+            ):
+                message_count += 1
                 if await self.process_message(message, channel):
                     sent_count += 1
-                    await asyncio.sleep(2)  # وقفه بین ارسال‌ها
+            
+            if not message_count:
+                logger.info(f"📭 پیامی یافت نشد")
             
             return sent_count
             
@@ -299,14 +461,24 @@ class CleanFileMonitor:
         logger.info("=" * 60)
         logger.info("🔄 شروع سیکل مانیتورینگ")
         
-        total_sent = 0
+        self._cycle_ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        for channel in self.source_channels:
-            sent = await self.check_channel(channel)
-            total_sent += sent
-            
-            if channel != self.source_channels[-1]:
-                await asyncio.sleep(3)  # وقفه بین کانال‌ها
+        # بررسی همزمان کانال‌ها با محدودیت تعداد
+        semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_CHANNELS)
+        
+        async def check_one(channel_username: str) -> int:
+            async with semaphore:
+                return await self.check_channel(channel_username)
+        
+        # همه نوشتن‌های دیتابیس در این سیکل در یک تراکنش ثبت می‌شوند
+        try:
+            results = await asyncio.gather(
+                *(check_one(channel) for channel in config.SOURCE_CHANNELS)
+            )
+        finally:
+            await self.flush_processed_files()
+        
+        total_sent = sum(results)
         
         logger.info(f"✅ سیکل کامل شد. {total_sent} فایل کپی شد")
         logger.info("=" * 60)
@@ -318,27 +490,28 @@ class CleanFileMonitor:
         if not self.db_conn:
             return
         
-        cursor = await self.db_conn.execute('''
+        # آخرین فایل‌ها از روی ایندکس processed_at خوانده می‌شوند
+        rows = await self._fetchall('''
             SELECT 
                 COUNT(*) as total,
                 COUNT(DISTINCT channel_id) as channels,
-                GROUP_CONCAT(DISTINCT file_name) as recent_files
+                (
+                    SELECT GROUP_CONCAT(file_name, ',') FROM (
+                        SELECT file_name FROM processed_files
+                        ORDER BY processed_at DESC
+                        LIMIT 3
+                    )
+                ) as recent_files
             FROM processed_files
-            ORDER BY processed_at DESC
-            LIMIT 5
         ''')
         
-        stats = await cursor.fetchone()
-        await cursor.close()
-        
-        if stats:
-            total, channels, recent_files = stats
+        if rows:
+            total, channels, recent_files = rows[0]
             logger.info("📊 آمار:")
             logger.info(f"   📁 کل فایل‌ها: {total}")
             logger.info(f"   📡 کانال‌های پردازش شده: {channels}")
             if recent_files:
-                files = recent_files.split(',')[:3]
-                logger.info(f"   🆕 آخرین فایل‌ها: {', '.join(files)}")
+                logger.info(f"   🆕 آخرین فایل‌ها: {recent_files.replace(',', ', ')}")
     
     async def start(self):
         """شروع مانیتورینگ"""
@@ -352,15 +525,18 @@ class CleanFileMonitor:
             # احراز هویت
             await self.authenticate()
             
+            # دریافت موجودیت کانال‌های مبدا
+            await self._resolve_entities()
+            
             # بررسی دسترسی به مقصد
             if not await self.check_destination_access():
                 logger.error("❌ دسترسی به کانال مقصد ممکن نیست")
                 return
             
-            logger.info(f"⏱️  بررسی هر {self.check_interval} ثانیه")
-            logger.info(f"📨 بررسی {self.messages_to_check} پیام آخر هر کانال")
-            logger.info(f"🎯 جستجوی فایل‌های: *{self.target_extension}")
-            logger.info(f"🏷️  آیدی در پیام‌ها: @{self.destination_id}")
+            logger.info(f"⏱️  بررسی هر {config.CHECK_INTERVAL} ثانیه")
+            logger.info(f"📨 بررسی {config.MESSAGES_TO_CHECK} پیام آخر هر کانال")
+            logger.info(f"🎯 جستجوی فایل‌های: *{config.TARGET_EXTENSION}")
+            logger.info(f"🏷️  آیدی در پیام‌ها: @{config.DESTINATION_ID}")
             logger.info("🟢 ربات فعال. Ctrl+C برای توقف")
             
             await self.show_stats()
@@ -379,11 +555,14 @@ class CleanFileMonitor:
                 
                 # انتظار برای سیکل بعدی
                 if self.is_running:
-                    logger.info(f"⏳ انتظار {self.check_interval} ثانیه...")
-                    for _ in range(self.check_interval):
-                        if not self.is_running:
-                            break
-                        await asyncio.sleep(1)
+                    logger.info(f"⏳ انتظار {config.CHECK_INTERVAL} ثانیه...")
+                    try:
+                        await asyncio.wait_for(
+                            self._stop_event.wait(),
+                            timeout=config.CHECK_INTERVAL
+                        )
+                    except asyncio.TimeoutError:
+                        pass
         
         except KeyboardInterrupt:
             logger.info("\n🛑 توقف درخواست شد...")
@@ -398,19 +577,35 @@ class CleanFileMonitor:
         self.is_running = False
         
         if self.db_conn:
-            await self.db_conn.close()
+            try:
+                await self.flush_processed_files()
+            except Exception as e:
+                logger.error(f"❌ خطا در ذخیره رکوردهای باقی‌مانده: {e}")
+            await self._run_db(self.db_conn.close)
             logger.info("✅ دیتابیس بسته شد")
         
+        self._db_executor.shutdown(wait=True)
+        
         if self.client.is_connected():
             await self.client.disconnect()
             logger.info("✅ اتصال تلگرام بسته شد")
         
         logger.info("👋 ربات متوقف شد")
     
+    def stop(self):
+        """درخواست توقف و بیدار کردن حلقه انتظار"""
+        self.is_running = False
+        self._stop_event.set()
+    
     def setup_signals(self):
         """تنظیم سیگنال‌ها"""
-        signal.signal(signal.SIGINT, lambda s, f: setattr(self, 'is_running', False))
-        signal.signal(signal.SIGTERM, lambda s, f: setattr(self, 'is_running', False))
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except NotImplementedError:
+                # ویندوز add_signal_handler ندارد
+                signal.signal(sig, lambda s, f: loop.call_soon_threadsafe(self.stop))
 
 async def main():
     """تابع اصلی"""
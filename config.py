@@ -1,30 +1,39 @@
 import os
 import logging
+from typing import Final, List
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # API اطلاعات
-API_ID = int(os.getenv('API_ID', 0))
-API_HASH = os.getenv('API_HASH', '')
-PHONE_NUMBER = os.getenv('PHONE_NUMBER', '')
+API_ID: Final[int] = int(os.getenv('API_ID', 0))
+API_HASH: Final[str] = os.getenv('API_HASH', '')
+PHONE_NUMBER: Final[str] = os.getenv('PHONE_NUMBER', '')
 
 # تنظیمات مانیتورینگ
-CHECK_INTERVAL = int(os.getenv('CHECK_INTERVAL', 300))
-MESSAGES_TO_CHECK = int(os.getenv('MESSAGES_TO_CHECK', 5))
-TARGET_EXTENSION = os.getenv('TARGET_EXTENSION', '.npvt').lower()
-DESTINATION_CHANNEL = os.getenv('DESTINATION_CHANNEL', '').strip()
+CHECK_INTERVAL: Final[int] = int(os.getenv('CHECK_INTERVAL', 300))
+MESSAGES_TO_CHECK: Final[int] = int(os.getenv('MESSAGES_TO_CHECK', 5))
+TARGET_EXTENSION: Final[str] = os.getenv('TARGET_EXTENSION', '.npvt').lower()
+DESTINATION_CHANNEL: Final[str] = os.getenv('DESTINATION_CHANNEL', '').strip()
+MAX_CONCURRENT_CHANNELS: Final[int] = max(1, int(os.getenv('MAX_CONCURRENT_CHANNELS', 4)))
+MAX_SEND_RETRIES: Final[int] = max(1, int(os.getenv('MAX_SEND_RETRIES', 5)))
+
+# آیدی کانال مقصد بدون @ (برای نام فایل و کپشن)
+DESTINATION_ID: Final[str] = DESTINATION_CHANNEL.lstrip('@')
 
 # تنظیمات نام‌گذاری
-FILE_PREFIX = os.getenv('FILE_PREFIX', 'Hamipn_')
-SHOW_SEQUENCE_NUMBER = os.getenv('SHOW_SEQUENCE_NUMBER', 'true').lower() == 'true'
+FILE_PREFIX: Final[str] = os.getenv('FILE_PREFIX', 'Hamipn_')
+SHOW_SEQUENCE_NUMBER: Final[bool] = os.getenv('SHOW_SEQUENCE_NUMBER', 'true').lower() == 'true'
 
 # لیست کانال‌های مبدا
 source_channels_str = os.getenv('SOURCE_CHANNELS', '')
-SOURCE_CHANNELS = [c.strip() for c in source_channels_str.split(',') if c.strip()]
+SOURCE_CHANNELS: Final[List[str]] = [c.strip() for c in source_channels_str.split(',') if c.strip()]
 
 # مسیر فایل سشن (برای ذخیره دائمی)
-SESSION_FILE = 'userbot_session.session'
+SESSION_FILE: Final[str] = 'userbot_session.session'
+
+# فایل دیتابیس UserBot
+DATABASE_FILE: Final[str] = os.getenv('DATABASE_FILE', 'user_monitor.db')
 
 # لاگ
 logging.basicConfig(
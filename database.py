@@ -15,6 +15,12 @@ class DatabaseManager:
         """راه‌اندازی دیتابیس"""
         self.conn = await aiosqlite.connect(self.db_file)
         
+        # تنظیمات SQLite برای کاهش fsync در هر commit
+        await self.conn.execute('PRAGMA journal_mode=WAL')
+        await self.conn.execute('PRAGMA synchronous=NORMAL')
+        await self.conn.execute('PRAGMA temp_store=MEMORY')
+        await self.conn.execute('PRAGMA cache_size=-65536')
+        
         # جدول فایل‌های پردازش شده
         await self.conn.execute('''
             CREATE TABLE IF NOT EXISTS processed_files (
@@ -58,6 +64,15 @@ class DatabaseManager:
             ON processed_files(channel_username)
         ''')
         
+        # جدول آخرین پیام بررسی شده هر کانال
+        await self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS channel_state (
+                channel_username TEXT PRIMARY KEY,
+                last_message_id INTEGER DEFAULT 0,
+                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
         await self.conn.commit()
         
         # مقداردهی اولیه شمارنده اگر وجود ندارد
@@ -65,69 +80,61 @@ class DatabaseManager:
         
         config.logger.info("✅ دیتابیس راه‌اندازی شد")
     
+    async def _fetchall(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """اجرای کوئری و دریافت نتیجه در یک رفت‌وبرگشت"""
+        return await self.conn.execute_fetchall(sql, params)
+    
     async def init_counter(self, counter_name: str):
         """مقداردهی اولیه شمارنده"""
-        cursor = await self.conn.execute(
-            'SELECT 1 FROM counters WHERE counter_name = ?',
-            (counter_name,)
+        await self.conn.execute(
+            'INSERT OR IGNORE INTO counters (counter_name, counter_value) VALUES (?, ?)',
+            (counter_name, 0)
         )
-        if not await cursor.fetchone():
-            await self.conn.execute(
-                'INSERT INTO counters (counter_name, counter_value) VALUES (?, ?)',
-                (counter_name, 0)
-            )
-            await self.conn.commit()
-        await cursor.close()
+        await self.conn.commit()
     
     async def get_next_sequence_number(self, counter_name: str = 'file_counter') -> int:
         """دریافت شماره ترتیب بعدی"""
-        async with self.conn.execute(
-            'SELECT counter_value FROM counters WHERE counter_name = ?',
+        # افزایش و خواندن شمارنده در یک دستور (نیازمند SQLite 3.35+)
+        rows = await self._fetchall(
+            'UPDATE counters SET counter_value = counter_value + 1, '
+            'last_updated = CURRENT_TIMESTAMP WHERE counter_name = ? '
+            'RETURNING counter_value',
             (counter_name,)
-        ) as cursor:
-            result = await cursor.fetchone()
-            current_value = result[0] if result else 0
-        
-        # افزایش شمارنده
-        new_value = current_value + 1
-        await self.conn.execute(
-            'UPDATE counters SET counter_value = ?, last_updated = CURRENT_TIMESTAMP WHERE counter_name = ?',
-            (new_value, counter_name)
         )
-        await self.conn.commit()
-        
-        return new_value
+        return rows[0][0] if rows else 0
     
     async def get_current_sequence_number(self, counter_name: str = 'file_counter') -> int:
         """دریافت شماره ترتیب فعلی"""
-        async with self.conn.execute(
+        rows = await self._fetchall(
             'SELECT counter_value FROM counters WHERE counter_name = ?',
             (counter_name,)
-        ) as cursor:
-            result = await cursor.fetchone()
-            return result[0] if result else 0
+        )
+        return rows[0][0] if rows else 0
     
     async def is_file_processed(self, file_hash: str) -> bool:
         """بررسی پردازش فایل"""
-        async with self.conn.execute(
-            'SELECT 1 FROM processed_files WHERE file_hash = ?',
+        rows = await self._fetchall(
+            'SELECT 1 FROM processed_files WHERE file_hash = ? LIMIT 1',
             (file_hash,)
-        ) as cursor:
-            result = await cursor.fetchone()
-            return result is not None
+        )
+        return bool(rows)
+    
+    async def load_all_hashes(self) -> List[str]:
+        """دریافت هش همه فایل‌های پردازش شده"""
+        rows = await self._fetchall('SELECT file_hash FROM processed_files')
+        return [row[0] for row in rows]
     
     async def save_processed_file(self, file_hash: str, original_filename: str, 
                                  new_filename: str, sequence_number: int, 
                                  channel_username: str, file_size: int):
         """ذخیره اطلاعات فایل پردازش شده"""
         await self.conn.execute('''
-            INSERT INTO processed_files 
+            INSERT OR IGNORE INTO processed_files 
             (file_hash, original_filename, new_filename, sequence_number, 
              channel_username, file_size)
             VALUES (?, ?, ?, ?, ?, ?)
         ''', (file_hash, original_filename, new_filename, sequence_number, 
               channel_username, file_size))
-        await self.conn.commit()
     
     async def log_activity(self, action: str, details: str = ""):
         """ثبت فعالیت در لاگ"""
@@ -135,41 +142,79 @@ class DatabaseManager:
             'INSERT INTO activity_log (action, details) VALUES (?, ?)',
             (action, details)
         )
-        await self.conn.commit()
+    
+    async def get_channel_states(self) -> Dict[str, int]:
+        """دریافت آخرین شناسه پیام بررسی شده هر کانال"""
+        rows = await self._fetchall(
+            'SELECT channel_username, last_message_id FROM channel_state'
+        )
+        return dict(rows)
+    
+    async def set_channel_state(self, channel_username: str, last_message_id: int):
+        """ذخیره آخرین شناسه پیام بررسی شده کانال"""
+        await self.conn.execute('''
+            INSERT INTO channel_state (channel_username, last_message_id)
+            VALUES (?, ?)
+            ON CONFLICT(channel_username) DO UPDATE SET
+                last_message_id = excluded.last_message_id,
+                last_updated = CURRENT_TIMESTAMP
+        ''', (channel_username, last_message_id))
+    
+    async def log_activities(self, entries: List[Tuple[str, str]]):
+        """ثبت دسته‌ای فعالیت‌ها با یک دستور"""
+        await self.conn.executemany(
+            'INSERT INTO activity_log (action, details) VALUES (?, ?)',
+            entries
+        )
+    
+    async def flush(self):
+        """ثبت تغییرات در انتظار در یک تراکنش"""
+        if self.conn:
+            await self.conn.commit()
     
     async def get_file_statistics(self) -> Dict:
         """دریافت آمار فایل‌ها"""
-        stats = {}
+        stats = {
+            'total_files': 0,
+            'files_by_channel': [],
+            'recent_files': [],
+            'current_sequence': 0
+        }
         
-        # تعداد کل فایل‌ها
-        async with self.conn.execute(
-            'SELECT COUNT(*) FROM processed_files'
-        ) as cursor:
-            stats['total_files'] = (await cursor.fetchone())[0]
-        
-        # تعداد فایل‌ها بر اساس کانال
-        async with self.conn.execute('''
-            SELECT channel_username, COUNT(*) 
+        # همه آمار در یک کوئری؛ ستون اول نوع هر ردیف را مشخص می‌کند
+        rows = await self._fetchall('''
+            SELECT 'total', NULL, COUNT(*), NULL FROM processed_files
+            UNION ALL
+            SELECT 'channel', channel_username, COUNT(*), NULL 
             FROM processed_files 
             GROUP BY channel_username
-        ''') as cursor:
-            stats['files_by_channel'] = await cursor.fetchall()
-        
-        # آخرین فایل‌ها
-        async with self.conn.execute('''
-            SELECT new_filename, sequence_number, processed_at 
-            FROM processed_files 
-            ORDER BY sequence_number DESC 
-            LIMIT 5
-        ''') as cursor:
-            stats['recent_files'] = await cursor.fetchall()
+            UNION ALL
+            SELECT * FROM (
+                SELECT 'recent', new_filename, sequence_number, processed_at 
+                FROM processed_files 
+                ORDER BY sequence_number DESC 
+                LIMIT 5
+            )
+            UNION ALL
+            SELECT 'sequence', NULL, counter_value, NULL 
+            FROM counters 
+            WHERE counter_name = ?
+        ''', ('file_counter',))
         
-        # شماره ترتیب فعلی
-        stats['current_sequence'] = await self.get_current_sequence_number()
+        for kind, name, value, date in rows:
+            if kind == 'total':
+                stats['total_files'] = value
+            elif kind == 'channel':
+                stats['files_by_channel'].append((name, value))
+            elif kind == 'recent':
+                stats['recent_files'].append((name, value, date))
+            else:
+                stats['current_sequence'] = value
         
         return stats
     
     async def close(self):
         """بستن اتصال دیتابیس"""
         if self.conn:
+            await self.flush()
             await self.conn.close()
\ No newline at end of file
@@ -1,33 +1,44 @@
-import os
 import re
 from typing import Optional, Tuple
 import config
 
+# جدول حذف کاراکترهای نامعتبر در نام فایل
+_BAD_CHARS_TABLE = str.maketrans('', '', '<>:"/\\|?*')
+
+def _split_ext(filename: str) -> Tuple[str, str]:
+    """جدا کردن پسوند از آخرین نقطه (نام فقط-پسوند مثل .npvt و نقطه انتهایی هم پشتیبانی می‌شوند)"""
+    name, dot, ext = filename.rpartition('.')
+    if not dot:
+        return filename, ''
+    return name, f".{ext}" if ext else ''
+
 class FileNamingSystem:
     """سیستم نام‌گذاری هوشمند فایل‌ها"""
     
     def __init__(self, prefix: str = None, show_sequence: bool = None):
         self.prefix = prefix or config.FILE_PREFIX
         self.show_sequence = show_sequence if show_sequence is not None else config.SHOW_SEQUENCE_NUMBER
-        self.destination_id = config.DESTINATION_CHANNEL.replace('@', '')
+        self.destination_id = config.DESTINATION_ID
+        
+        # الگوی از پیش کامپایل شده برای استخراج نام اصلی
+        self._extract_re = re.compile(
+            rf'^{re.escape(self.prefix)}\d+_{re.escape(self.destination_id)}_'
+        )
     
     def clean_filename(self, filename: str) -> str:
         """پاکسازی نام فایل از کاراکترهای نامعتبر"""
         # حذف پسوند
-        if '.' in filename:
-            name, ext = filename.rsplit('.', 1)
-        else:
-            name, ext = filename, ''
+        name, ext = _split_ext(filename)
         
         # حذف کاراکترهای نامعتبر
-        name = re.sub(r'[<>:"/\\|?*]', '', name)
-        name = re.sub(r'\s+', ' ', name).strip()
+        name = name.translate(_BAD_CHARS_TABLE)
+        name = ' '.join(name.split())
         
         # محدودیت طول
         if len(name) > 50:
             name = name[:50]
         
-        return f"{name}.{ext}" if ext else name
+        return f"{name}{ext}"
     
     def generate_new_filename(self, original_filename: str, sequence_number: int) -> str:
         """تولید نام جدید برای فایل"""
@@ -35,10 +46,7 @@ class FileNamingSystem:
         cleaned_name = self.clean_filename(original_filename)
         
         # استخراج پسوند
-        if '.' in cleaned_name:
-            name_part, extension = cleaned_name.rsplit('.', 1)
-        else:
-            name_part, extension = cleaned_name, ''
+        name_part, extension = _split_ext(cleaned_name)
         
         # ساخت نام جدید
         if self.show_sequence:
@@ -53,17 +61,13 @@ class FileNamingSystem:
             new_name = f"{new_name}_{short_name}"
         
         # اضافه کردن پسوند
-        if extension:
-            new_name = f"{new_name}.{extension}"
-        
-        return new_name
+        return f"{new_name}{extension}"
     
     def extract_original_name(self, new_filename: str) -> Optional[str]:
         """استخراج نام اصلی از نام جدید"""
         try:
             # حذف پیشوند و شماره
-            pattern = re.compile(rf'^{re.escape(self.prefix)}\d+_{re.escape(self.destination_id)}_')
-            match = pattern.match(new_filename)
+            match = self._extract_re.match(new_filename)
             
             if match:
                 remaining = new_filename[match.end():]
@@ -1,11 +1,15 @@
 import asyncio
+import hashlib
 import logging
 import os
+import struct
 import sys
 import signal
 import tempfile
+import uuid
 from datetime import datetime
-from typing import Optional, Dict, Tuple
+from pathlib import Path
+from typing import Optional, Dict, Tuple, List, Set
 
 from telethon import TelegramClient
 from telethon.tl.types import (
@@ -20,9 +24,18 @@ from telethon.errors import (
 import config
 from database import DatabaseManager
 from file_namer import FileNamingSystem
+from rate_limiter import TokenBucket
 
 logger = config.logger
 
+# ساختار از پیش کامپایل شده کلید هش: (id, access_hash, size)
+_HASH_KEY = struct.Struct("<qqq")
+
+# دانلود موازی برای فایل‌های بزرگ‌تر از این حجم
+FAST_DOWNLOAD_THRESHOLD = 20 * 1024 * 1024
+FAST_DOWNLOAD_CHUNK = 512 * 1024  # حداکثر اندازه درخواست تلگرام
+FAST_DOWNLOAD_WORKERS = 4
+
 class AdvancedTelegramMonitor:
     """ربات مانیتورینگ پیشرفته با نام‌گذاری هوشمند - نسخه اصلاح شده"""
     
@@ -47,17 +60,61 @@ class AdvancedTelegramMonitor:
         self.target_extension = config.TARGET_EXTENSION
         self.messages_to_check = config.MESSAGES_TO_CHECK
         self.check_interval = config.CHECK_INTERVAL
+        self._ext_lower = self.target_extension.lower()
         
         self.is_running = True
+        self._stop = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        # هش فایل‌های پردازش شده (کش حافظه برای حذف کوئری در هر پیام)
+        self._seen: Set[str] = set()
+        
+        # کش entity کانال‌ها برای جلوگیری از ResolveUsername در هر سیکل
+        self._entity_cache: Dict[str, Channel] = {}
+        
+        # آخرین شناسه پیام بررسی شده هر کانال
+        self._last_id: Dict[str, int] = {}
+        
+        # بافر لاگ فعالیت‌ها؛ به صورت دسته‌ای در دیتابیس ثبت می‌شود
+        self._log_buf: List[Tuple[str, str]] = []
+        self._log_task: Optional[asyncio.Task] = None
+        
+        # محدودیت نرخ ارسال: شروع با یک فایل در 3 ثانیه، تطبیق با FloodWait
+        self._send_bucket = TokenBucket(rate=1 / 3, capacity=3, max_rate=1.0)
+        
+        # کارهای پس‌زمینه (پاکسازی فایل‌های موقت)
+        self._bg_tasks: Set[asyncio.Task] = set()
+        
+        # لاگ‌های پرتکرار فقط در صورت فعال بودن سطح INFO ساخته می‌شوند
+        self._log_info = logger.isEnabledFor(logging.INFO)
         
         logger.info("🚀 ربات پیشرفته مانیتورینگ راه‌اندازی شد")
     
+    @staticmethod
+    def _extract_filename(document: Document) -> Optional[str]:
+        """استخراج نام اصلی فایل از attribute های سند"""
+        return next(
+            (attr.file_name for attr in document.attributes
+             if isinstance(attr, DocumentAttributeFilename)),
+            None
+        )
+    
     def get_file_hash(self, document: Document) -> str:
-        """ایجاد هش یکتا برای فایل"""
-        if hasattr(document, 'id') and hasattr(document, 'size'):
-            date_str = str(getattr(document, 'date', datetime.now()).timestamp())
-            return f"{document.id}_{document.size}_{date_str}"
-        return f"hash_{datetime.now().timestamp()}"
+        """ایجاد هش پایدار برای فایل بر اساس شناسه، access_hash و حجم"""
+        key = _HASH_KEY.pack(
+            document.id,
+            getattr(document, 'access_hash', 0) or 0,
+            document.size
+        )
+        return hashlib.blake2b(key, digest_size=16).hexdigest()
+    
+    @staticmethod
+    def _legacy_file_hash(document: Document) -> Optional[str]:
+        """کلید قالب قدیمی (id_size_date) برای ردیف‌های ثبت شده پیش از تغییر هش"""
+        date = getattr(document, 'date', None)
+        if date is None:
+            return None
+        return f"{document.id}_{document.size}_{date.timestamp()}"
     
     async def authenticate(self):
         """احراز هویت با ذخیره سشن"""
@@ -72,7 +129,7 @@ class AdvancedTelegramMonitor:
                 logger.info("📱 کد تأیید ارسال شد")
                 
                 # دریافت کد از کاربر
-                code = input("✏️  لطفاً کد 5 رقمی را وارد کنید: ").strip()
+                code = (await asyncio.to_thread(input, "✏️  لطفاً کد 5 رقمی را وارد کنید: ")).strip()
                 
                 # تلاش برای ورود با کد
                 try:
@@ -80,7 +137,7 @@ class AdvancedTelegramMonitor:
                     logger.info("✅ ورود با کد موفقیت‌آمیز بود")
                 except SessionPasswordNeededError:
                     # اگر رمز دو مرحله‌ای نیاز است
-                    password = input("🔑 رمز دو مرحله‌ای را وارد کنید: ")
+                    password = await asyncio.to_thread(input, "🔑 رمز دو مرحله‌ای را وارد کنید: ")
                     await self.client.sign_in(password=password)
                     logger.info("✅ ورود با رمز دو مرحله‌ای موفق بود")
                 
@@ -95,14 +152,22 @@ class AdvancedTelegramMonitor:
         # ذخیره سشن
         logger.info(f"💾 سشن در {config.SESSION_FILE} ذخیره شد")
         
-        await self.db.log_activity("USER_AUTHENTICATED", f"@{me.username}")
+        self._log_buf.append(("USER_AUTHENTICATED", f"@{me.username}"))
         
         return me
     
+    async def get_cached_entity(self, username: str) -> Channel:
+        """دریافت entity کانال از کش یا سرور"""
+        entity = self._entity_cache.get(username)
+        if entity is None:
+            entity = await self.client.get_entity(username)
+            self._entity_cache[username] = entity
+        return entity
+    
     async def check_destination_access(self):
         """بررسی دسترسی به کانال مقصد"""
         try:
-            dest_entity = await self.client.get_entity(self.destination_channel)
+            dest_entity = await self.get_cached_entity(self.destination_channel)
             logger.info(f"🎯 کانال مقصد: {getattr(dest_entity, 'title', 'Unknown')}")
             
             return True
@@ -120,26 +185,26 @@ class AdvancedTelegramMonitor:
             document = message.media.document
             
             # استخراج نام اصلی فایل
-            original_filename = None
-            for attr in document.attributes:
-                if isinstance(attr, DocumentAttributeFilename):
-                    original_filename = attr.file_name
-                    break
+            original_filename = self._extract_filename(document)
             
             if not original_filename:
                 return None
             
-            # ایجاد فایل موقت با نام مشخص
-            temp_dir = tempfile.gettempdir()
-            temp_name = f"tg_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{original_filename}"
-            temp_path = os.path.join(temp_dir, temp_name)
+            # ایجاد فایل موقت با نام یکتا (حذف جداکننده‌های مسیر از نام اصلی)
+            safe_name = os.path.basename(original_filename.replace('\\', '/'))
+            temp_name = f"tg_{uuid.uuid4().hex[:12]}_{safe_name}"
+            temp_path = os.path.join(tempfile.gettempdir(), temp_name)
             
             # دانلود فایل
-            logger.info(f"⬇️  دانلود: {original_filename}")
-            downloaded = await self.client.download_media(
-                message.media,
-                file=temp_path
-            )
+            if self._log_info:
+                logger.info("⬇️  دانلود: %s", original_filename)
+            if document.size > FAST_DOWNLOAD_THRESHOLD and hasattr(os, 'pwrite'):
+                downloaded = await self._fast_download(document, temp_path)
+            else:
+                downloaded = await self.client.download_media(
+                    message.media,
+                    file=temp_path
+                )
             
             if downloaded and os.path.exists(downloaded):
                 file_size = os.path.getsize(downloaded)
@@ -151,6 +216,49 @@ class AdvancedTelegramMonitor:
             logger.error(f"❌ خطا در دانلود فایل: {e}")
             return None
     
+    async def _fast_download(self, document: Document, path: str,
+                             workers: int = FAST_DOWNLOAD_WORKERS) -> str:
+        """دانلود موازی فایل بزرگ با چند درخواست همزمان و نوشتن با pwrite"""
+        total_chunks = -(-document.size // FAST_DOWNLOAD_CHUNK)
+        stride = workers * FAST_DOWNLOAD_CHUNK
+        
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        
+        async def worker(index: int):
+            # هر کارگر تکه‌های index، index+workers، ... را دریافت می‌کند
+            position = index * FAST_DOWNLOAD_CHUNK
+            async for chunk in self.client.iter_download(
+                document,
+                offset=position,
+                stride=stride,
+                limit=len(range(index, total_chunks, workers)),
+                chunk_size=FAST_DOWNLOAD_CHUNK,
+                request_size=FAST_DOWNLOAD_CHUNK,
+                file_size=document.size
+            ):
+                os.pwrite(fd, chunk, position)
+                position += stride
+        
+        tasks = []
+        try:
+            os.ftruncate(fd, document.size)
+            tasks = [
+                asyncio.create_task(worker(i))
+                for i in range(min(workers, total_chunks))
+            ]
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # توقف بقیه کارگرها پیش از بستن فایل و حذف فایل ناقص
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            os.close(fd)
+            Path(path).unlink(missing_ok=True)
+            raise
+        
+        os.close(fd)
+        return path
+    
     async def send_file_with_new_name(self, file_path: str, original_name: str, 
                                      file_size: int, channel_username: str, 
                                      message: Message) -> bool:
@@ -162,48 +270,68 @@ class AdvancedTelegramMonitor:
             # تولید نام جدید
             new_filename = self.namer.generate_new_filename(original_name, sequence_number)
             
-            # خواندن فایل
-            with open(file_path, 'rb') as f:
-                file_data = f.read()
-            
             # ایجاد کپشن
-            destination_id = config.DESTINATION_CHANNEL.replace('@', '')
-            file_size_mb = file_size / (1024 * 1024)
-            
-            caption_lines = [
-                f"📁 **{new_filename}**",
-                "",
-                f"🔢 **شماره:** {sequence_number}",
-                f"🏷️  **کانال:** @{destination_id}",
-                f"📦 **حجم:** {file_size_mb:.2f} MB",
-                f"📅 **تاریخ:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-                "",
+            caption = (
+                f"📁 **{new_filename}**\n"
+                "\n"
+                f"🔢 **شماره:** {sequence_number}\n"
+                f"🏷️  **کانال:** @{config.DESTINATION_ID}\n"
+                f"📦 **حجم:** {file_size / 1048576:.2f} MB\n"
+                f"📅 **تاریخ:** {datetime.now():%Y-%m-%d %H:%M:%S}\n"
+                "\n"
                 "#فایل #کانال"
-            ]
-            
-            caption = "\n".join(caption_lines)
-            
-            # ارسال فایل
-            await self.client.send_file(
-                entity=self.destination_channel,
-                file=file_data,
-                caption=caption,
-                file_name=new_filename,
-                force_document=True,
-                silent=True,
-                allow_cache=False,
-                attributes=[DocumentAttributeFilename(new_filename)]
             )
             
-            logger.info(f"📤 ارسال شد: {new_filename} (شماره: {sequence_number})")
+            # فایل فقط یک بار آپلود می‌شود و تلاش‌های بعدی از همان هندل استفاده می‌کنند
+            uploaded_file = None
             
-            # ذخیره در دیتابیس - با استفاده از message
-            if hasattr(message, 'media') and hasattr(message.media, 'document'):
-                file_hash = self.get_file_hash(message.media.document)
+            for attempt in range(1, config.MAX_SEND_RETRIES + 1):
+                try:
+                    # انتظار برای توکن پیش از آپلود و ارسال؛ پس از FloodWait هر دو صبر می‌کنند
+                    await self._send_bucket.acquire()
+                    
+                    if uploaded_file is None:
+                        # یک بار باز می‌شود و به صورت تکه‌ای از دیسک آپلود می‌شود
+                        with open(file_path, 'rb') as f:
+                            if hasattr(os, 'posix_fadvise'):
+                                # پیش‌خوانی بزرگ‌تر برای خواندن ترتیبی
+                                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                            
+                            uploaded_file = await self.client.upload_file(
+                                f,
+                                file_size=file_size,
+                                file_name=new_filename
+                            )
+                    
+                    await self.client.send_file(
+                        entity=self._entity_cache.get(self.destination_channel, self.destination_channel),
+                        file=uploaded_file,
+                        caption=caption,
+                        file_name=new_filename,
+                        force_document=True,
+                        silent=True,
+                        attributes=[DocumentAttributeFilename(new_filename)]
+                    )
+                    self._send_bucket.reward()
+                    break
+                
+                except FloodWaitError as e:
+                    logger.warning(
+                        f"⏳ FloodWait: {e.seconds} ثانیه "
+                        f"(تلاش {attempt}/{config.MAX_SEND_RETRIES})"
+                    )
+                    # کاهش نرخ؛ ارسال بعدی (از هر کانالی) تا پایان انتظار صبر می‌کند
+                    self._send_bucket.throttle(e.seconds)
             else:
-                # ایجاد هش جایگزین
-                file_hash = f"{datetime.now().timestamp()}_{original_name}"
+                logger.error(f"❌ ارسال {new_filename} پس از {config.MAX_SEND_RETRIES} تلاش ناموفق بود")
+                self._log_buf.append(("SEND_ERROR", f"{new_filename}: FloodWait"))
+                return False
             
+            if self._log_info:
+                logger.info("📤 ارسال شد: %s (شماره: %d)", new_filename, sequence_number)
+            
+            # ذخیره در دیتابیس
+            file_hash = self.get_file_hash(message.media.document)
             await self.db.save_processed_file(
                 file_hash=file_hash,
                 original_filename=original_name,
@@ -213,109 +341,175 @@ class AdvancedTelegramMonitor:
                 file_size=file_size
             )
             
-            await self.db.log_activity("FILE_SENT", f"{new_filename} - #{sequence_number}")
+            self._log_buf.append(("FILE_SENT", f"{new_filename} - #{sequence_number}"))
             
             return True
             
-        except FloodWaitError as e:
-            logger.warning(f"⏳ FloodWait: {e.seconds} ثانیه")
-            await asyncio.sleep(e.seconds)
-            return await self.send_file_with_new_name(file_path, original_name, file_size, channel_username, message)
-            
         except Exception as e:
             logger.error(f"❌ خطا در ارسال فایل: {e}")
-            await self.db.log_activity("SEND_ERROR", str(e))
+            self._log_buf.append(("SEND_ERROR", str(e)))
             return False
     
-    async def process_message(self, message: Message, channel: Channel) -> bool:
-        """پردازش پیام"""
+    async def process_message(self, message: Message,
+                              failed_ids: List[int]) -> Optional[Tuple[str, str, int]]:
+        """فیلتر و دانلود پیام؛ ارسال در مرحله بعدی خط لوله انجام می‌شود"""
+        file_hash = None
         try:
             # بررسی وجود فایل
             if not message.media or not isinstance(message.media, MessageMediaDocument):
-                return False
+                return None
             
             document = message.media.document
             
             # بررسی پسوند
-            original_filename = None
-            for attr in document.attributes:
-                if isinstance(attr, DocumentAttributeFilename):
-                    original_filename = attr.file_name
-                    break
-            
+            original_filename = self._extract_filename(document)
             if not original_filename:
-                return False
+                return None
             
-            if not original_filename.lower().endswith(self.target_extension):
-                return False
+            if not original_filename.lower().endswith(self._ext_lower):
+                return None
             
-            logger.info(f"🎯 فایل پیدا شد: {original_filename}")
+            if self._log_info:
+                logger.info("🎯 فایل پیدا شد: %s", original_filename)
             
             # بررسی هش فایل (بعد از تأیید پسوند)
+            # ردیف‌های قدیمی دیتابیس هنوز با کلید قالب قبلی ثبت شده‌اند
             file_hash = self.get_file_hash(document)
-            if await self.db.is_file_processed(file_hash):
-                logger.info(f"⏭️  فایل قبلاً پردازش شده: {original_filename}")
-                return False
+            if file_hash in self._seen or self._legacy_file_hash(document) in self._seen:
+                if self._log_info:
+                    logger.info("⏭️  فایل قبلاً پردازش شده: %s", original_filename)
+                return None
+            
+            # رزرو هش پیش از دانلود تا نسخه تکراری (در همین دسته یا کانال دیگر) دوباره ارسال نشود
+            self._seen.add(file_hash)
             
             # دانلود فایل
             download_result = await self.download_file(message)
             if not download_result:
-                return False
+                self._seen.discard(file_hash)
+                failed_ids.append(message.id)
+            return download_result
             
-            file_path, original_name, file_size = download_result
-            
-            # ارسال با نام جدید
-            channel_username = getattr(channel, 'username', str(channel.id))
-            success = await self.send_file_with_new_name(
-                file_path, original_name, file_size, channel_username, message
+        except Exception as e:
+            logger.error(f"❌ خطا در پردازش پیام: {e}")
+            self._log_buf.append(("PROCESS_ERROR", str(e)))
+            if file_hash is not None:
+                self._seen.discard(file_hash)
+            failed_ids.append(message.id)
+            return None
+    
+    def remove_temp_file(self, file_path: str):
+        """پاکسازی فایل موقت در پس‌زمینه بدون مسدود کردن حلقه رویداد"""
+        try:
+            task = asyncio.create_task(
+                asyncio.to_thread(Path(file_path).unlink, missing_ok=True)
             )
+        except Exception as clean_error:
+            logger.warning(f"⚠️  خطا در پاکسازی فایل موقت: {clean_error}")
+            return
+        
+        self._bg_tasks.add(task)
+        task.add_done_callback(self._on_cleanup_done)
+    
+    def _on_cleanup_done(self, task: asyncio.Task):
+        """حذف کار تمام شده و گزارش خطای پاکسازی"""
+        self._bg_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.warning(f"⚠️  خطا در پاکسازی فایل موقت: {task.exception()}")
+    
+    async def _producer(self, messages, queue: asyncio.Queue, failed_ids: List[int]):
+        """مرحله دانلود: فایل‌های آماده را در صف قرار می‌دهد"""
+        try:
+            for message in messages:
+                download_result = await self.process_message(message, failed_ids)
+                if download_result:
+                    await queue.put((*download_result, message))
+        finally:
+            # پایان کار را به مصرف‌کننده اعلام می‌کند
+            await queue.put(None)
+    
+    async def _consumer(self, queue: asyncio.Queue, channel_username: str,
+                        failed_ids: List[int]) -> int:
+        """مرحله آپلود: فایل‌ها را از صف برداشته و ارسال می‌کند"""
+        sent_count = 0
+        
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
             
-            # پاکسازی فایل موقت
+            file_path, original_name, file_size, message = item
             try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-            except Exception as clean_error:
-                logger.warning(f"⚠️  خطا در پاکسازی فایل موقت: {clean_error}")
-            
-            return success
-            
-        except Exception as e:
-            logger.error(f"❌ خطا در پردازش پیام: {e}")
-            await self.db.log_activity("PROCESS_ERROR", str(e))
-            return False
+                if await self.send_file_with_new_name(
+                    file_path, original_name, file_size, channel_username, message
+                ):
+                    sent_count += 1
+                else:
+                    # آزادسازی رزرو تا در سیکل بعد دوباره تلاش شود
+                    self._seen.discard(self.get_file_hash(message.media.document))
+                    failed_ids.append(message.id)
+            finally:
+                self.remove_temp_file(file_path)
+        
+        return sent_count
     
     async def check_channel(self, channel_username: str) -> int:
         """بررسی یک کانال"""
         sent_count = 0
         
         try:
-            channel = await self.client.get_entity(channel_username)
-            channel_title = getattr(channel, 'title', channel_username)
-            logger.info(f"🔎 بررسی کانال: {channel_title}")
-            
-            # دریافت پیام‌ها
-            messages = await self.client.get_messages(
-                channel,
-                limit=self.messages_to_check
-            )
+            channel = await self.get_cached_entity(channel_username)
+            if self._log_info:
+                logger.info("🔎 بررسی کانال: %s", getattr(channel, 'title', channel_username))
+            
+            # دریافت فقط پیام‌های جدیدتر از آخرین پیام بررسی شده
+            last_id = self._last_id.get(channel_username, 0)
+            messages = [
+                message async for message in self.client.iter_messages(
+                    channel,
+                    limit=self.messages_to_check,
+                    min_id=last_id
+                )
+            ]
             
             if not messages:
-                logger.info(f"📭 پیامی یافت نشد")
+                if self._log_info:
+                    logger.info("📭 پیام جدیدی یافت نشد: %s", channel_username)
                 return 0
             
-            # پردازش پیام‌ها
-            for message in messages:
-                if await self.process_message(message, channel):
-                    sent_count += 1
-                    await asyncio.sleep(3)  # وقفه بین ارسال‌ها
+            # خط لوله: دانلود فایل بعدی همزمان با آپلود فایل قبلی
+            source_name = getattr(channel, 'username', None) or str(channel.id)
+            failed_ids: List[int] = []
+            queue = asyncio.Queue(maxsize=2)
+            _, sent_count = await asyncio.gather(
+                self._producer(messages, queue, failed_ids),
+                self._consumer(queue, source_name, failed_ids)
+            )
+            
+            # پیام‌های ناموفق در سیکل بعد دوباره بررسی می‌شوند
+            if failed_ids:
+                new_last_id = min(failed_ids) - 1
+            else:
+                new_last_id = max(message.id for message in messages)
+            
+            if new_last_id > last_id:
+                self._last_id[channel_username] = new_last_id
+                await self.db.set_channel_state(channel_username, new_last_id)
             
             return sent_count
             
         except ChannelPrivateError:
             logger.warning(f"🔒 کانال خصوصی است: {channel_username}")
+            self._entity_cache.pop(channel_username, None)
             return 0
+        except FloodWaitError as e:
+            # فقط همین کانال عقب می‌کشد؛ بقیه کانال‌ها ادامه می‌دهند
+            logger.warning(f"⏳ FloodWait در کانال {channel_username}: {e.seconds} ثانیه")
+            await asyncio.sleep(e.seconds)
+            return sent_count
         except Exception as e:
             logger.error(f"❌ خطا در بررسی کانال {channel_username}: {e}")
+            self._entity_cache.pop(channel_username, None)
             return 0
     
     async def monitoring_cycle(self):
@@ -323,22 +517,49 @@ class AdvancedTelegramMonitor:
         logger.info("=" * 60)
         logger.info("🔄 شروع سیکل مانیتورینگ")
         
-        total_sent = 0
+        # بررسی همزمان کانال‌ها با محدودیت تعداد
+        semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_CHANNELS)
         
-        for channel in self.source_channels:
-            sent = await self.check_channel(channel)
-            total_sent += sent
-            
-            if channel != self.source_channels[-1]:
-                await asyncio.sleep(2)
+        async def check_one(channel_username: str) -> int:
+            async with semaphore:
+                return await self.check_channel(channel_username)
+        
+        results = await asyncio.gather(
+            *(check_one(channel) for channel in self.source_channels),
+            return_exceptions=True
+        )
+        
+        total_sent = 0
+        for channel, result in zip(self.source_channels, results):
+            if isinstance(result, BaseException):
+                logger.error(f"❌ خطا در بررسی کانال {channel}: {result}")
+            else:
+                total_sent += result
         
         logger.info(f"✅ سیکل کامل شد. {total_sent} فایل ارسال شد")
         logger.info("=" * 60)
         
-        await self.db.log_activity("CYCLE_COMPLETE", f"ارسال شده: {total_sent}")
+        self._log_buf.append(("CYCLE_COMPLETE", f"ارسال شده: {total_sent}"))
+        await self._flush_logs()
         
         return total_sent
     
+    async def _flush_logs(self):
+        """ثبت لاگ‌های بافر شده با یک executemany و یک commit"""
+        entries, self._log_buf = self._log_buf, []
+        if entries:
+            await self.db.log_activities(entries)
+        await self.db.flush()
+    
+    async def _log_flusher(self):
+        """ثبت دوره‌ای بافر لاگ هر 5 ثانیه"""
+        while True:
+            await asyncio.sleep(5)
+            try:
+                await self._flush_logs()
+            except Exception as e:
+                logger.warning(f"⚠️  خطا در ثبت لاگ‌ها: {e}")
+    
     async def show_statistics(self):
         """نمایش آمار"""
         try:
@@ -367,8 +588,13 @@ class AdvancedTelegramMonitor:
             # اعتبارسنجی
             config.validate_config()
             
+            self._loop = asyncio.get_running_loop()
+            
             # راه‌اندازی دیتابیس
             await self.db.initialize()
+            self._seen = set(await self.db.load_all_hashes())
+            self._last_id = await self.db.get_channel_states()
+            self._log_task = asyncio.create_task(self._log_flusher())
             
             # احراز هویت (فقط بار اول نیاز به کد دارد)
             await self.authenticate()
@@ -401,12 +627,7 @@ class AdvancedTelegramMonitor:
                 # انتظار برای سیکل بعدی
                 if self.is_running:
                     logger.info(f"⏳ انتظار {self.check_interval} ثانیه...")
-                    for i in range(self.check_interval):
-                        if not self.is_running:
-                            break
-                        if i % 60 == 0 and i > 0:  # گزارش هر دقیقه
-                            logger.info(f"   ⏰ {i//60} دقیقه از {self.check_interval//60} گذشت...")
-                        await asyncio.sleep(1)
+                    await self.wait_for_next_cycle()
         
         except KeyboardInterrupt:
             logger.info("\n🛑 توقف درخواست شد...")
@@ -416,10 +637,42 @@ class AdvancedTelegramMonitor:
         finally:
             await self.cleanup()
     
+    async def wait_for_next_cycle(self):
+        """انتظار تا سیکل بعدی یا دریافت سیگنال توقف"""
+        elapsed = 0
+        while elapsed < self.check_interval:
+            # انتظار در بازه‌های یک دقیقه‌ای فقط برای گزارش پیشرفت
+            timeout = min(60, self.check_interval - elapsed)
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=timeout)
+                return
+            except asyncio.TimeoutError:
+                pass
+            
+            elapsed += timeout
+            if elapsed < self.check_interval:  # گزارش هر دقیقه
+                logger.info(f"   ⏰ {elapsed//60} دقیقه از {self.check_interval//60} گذشت...")
+    
     async def cleanup(self):
         """پاکسازی منابع"""
         self.is_running = False
         
+        if self._log_task:
+            self._log_task.cancel()
+            try:
+                await self._log_task
+            except asyncio.CancelledError:
+                pass
+        
+        try:
+            await self._flush_logs()
+        except Exception as e:
+            logger.warning(f"⚠️  خطا در ثبت لاگ‌ها: {e}")
+        
+        # منتظر پایان پاکسازی‌های در جریان
+        if self._bg_tasks:
+            await asyncio.gather(*self._bg_tasks, return_exceptions=True)
+        
         try:
             await self.db.close()
             logger.info("✅ دیتابیس بسته شد")
@@ -440,6 +693,8 @@ class AdvancedTelegramMonitor:
         def signal_handler(signum, frame):
             logger.info(f"📡 دریافت سیگنال {signum}")
             self.is_running = False
+            if self._loop:
+                self._loop.call_soon_threadsafe(self._stop.set)
         
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
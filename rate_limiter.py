@@ -0,0 +1,52 @@
+import asyncio
+import time
+from typing import Optional
+
+class TokenBucket:
+    """محدودکننده نرخ تطبیقی (سطل توکن) - کاهش نرخ با FloodWait و افزایش تدریجی با ارسال موفق"""
+    
+    def __init__(self, rate: float, capacity: float,
+                 max_rate: Optional[float] = None,
+                 min_rate: Optional[float] = None):
+        self._rate = rate
+        self._capacity = capacity
+        self._max_rate = max_rate or rate
+        self._min_rate = min_rate or rate / 10
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    @property
+    def rate(self) -> float:
+        """نرخ فعلی (توکن در ثانیه)"""
+        return self._rate
+    
+    def _refill(self):
+        """افزودن توکن‌ها بر اساس زمان گذشته"""
+        now = time.monotonic()
+        self._tokens = min(
+            self._capacity,
+            self._tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+    
+    async def acquire(self):
+        """انتظار تا آزاد شدن یک توکن"""
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+                self._refill()
+            self._tokens -= 1
+    
+    def throttle(self, seconds: float = 0):
+        """کاهش نرخ پس از FloodWait و توقف همه تا پایان زمان انتظار"""
+        self._refill()
+        self._rate = max(self._min_rate, self._rate / 2)
+        # توکن منفی یعنی درخواست‌های بعدی حداقل seconds ثانیه صبر می‌کنند
+        self._tokens = min(self._tokens, -seconds * self._rate)
+    
+    def reward(self):
+        """افزایش تدریجی نرخ پس از ارسال موفق"""
+        self._refill()
+        self._rate = min(self._max_rate, self._rate + self._max_rate / 20)
\ No newline at end of file
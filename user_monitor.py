@@ -1,9 +1,11 @@
 import asyncio
 import logging
+import random
 import sys
 import signal
 from datetime import datetime
-from typing import Optional, List
+from pathlib import Path
+from typing import Optional, List, Set, Dict
 
 from telethon import TelegramClient, events
 from telethon.tl.types import (
@@ -17,10 +19,38 @@ from telethon.errors import (
 
 import aiosqlite
 import config
+from rate_limiter import TokenBucket
 
 # استفاده از logger از config
 logger = config.logger
 
+# نام کوتاه محلی ماژول برای مقایسه مستقیم نوع در حلقه پرتکرار
+_FN = DocumentAttributeFilename
+
+# commit ایمنی پس از این تعداد نوشتن در یک سیکل طولانی
+SAFETY_COMMIT_EVERY = 50
+
+# صف لاگ فعالیت‌ها: ظرفیت صف و حداکثر ردیف در هر نوشتن دسته‌ای
+LOG_QUEUE_SIZE = 1024
+LOG_BATCH_SIZE = 256
+
+# نگهداری دیتابیس: هر چند سیکل و مدت نگهداری لاگ فعالیت‌ها
+MAINTENANCE_EVERY = 1000
+ACTIVITY_LOG_RETENTION_DAYS = 30
+
+# دستورات پرتکرار؛ رشته ثابت تا از کش دستورات آماده sqlite3 استفاده شود
+SQL_INSERT_LOG = 'INSERT INTO activity_log (action, details) VALUES (?, ?)'
+SQL_IS_PROCESSED = 'SELECT 1 FROM sent_messages WHERE channel_id = ? AND message_id = ?'
+SQL_MARK_SENT = (
+    'INSERT OR IGNORE INTO sent_messages '
+    '(message_id, channel_id, channel_username, file_name, file_size) '
+    'VALUES (?, ?, ?, ?, ?)'
+)
+SQL_BUMP_STATS = (
+    'UPDATE stats_counters SET total_files = total_files + 1, '
+    'total_size = total_size + ? WHERE id = 1'
+)
+
 class TelegramChannelMonitor:
     """کلاس اصلی برای مانیتورینگ کانال‌های تلگرام"""
     
@@ -40,19 +70,61 @@ class TelegramChannelMonitor:
         self.source_channels = config.SOURCE_CHANNELS
         self.destination_channel = config.DESTINATION_CHANNEL
         self.target_extension = config.TARGET_EXTENSION
+        self._target_ext = self.target_extension.lower()
+        self._target_ext_len = len(self._target_ext)
         self.messages_to_check = config.MESSAGES_TO_CHECK
         self.check_interval = config.CHECK_INTERVAL
         
         self.db_conn: Optional[aiosqlite.Connection] = None
+        self.db_reader: Optional[aiosqlite.Connection] = None
+        self._pending_writes = 0
+        # در طول سیکل، commit فقط با پایان سیکل (یا commit ایمنی) انجام می‌شود
+        self._in_cycle = False
         self.is_running = True
         
+        # لاگ فعالیت‌ها در پس‌زمینه و به صورت دسته‌ای نوشته می‌شود
+        self._log_queue: asyncio.Queue = asyncio.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._log_task: Optional[asyncio.Task] = None
+        self._dropped_logs = 0
+        # هماهنگی BEGIN سیکل با commit نویسنده لاگ
+        self._tx_lock = asyncio.Lock()
+        self._stop_event = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        # محدودیت نرخ فوروارد مشترک بین همه کانال‌ها، تطبیق با FloodWait
+        self._forward_bucket = TokenBucket(rate=20, capacity=30)
+        
+        # entity کانال‌های مبدا؛ کانال‌های دریافت نشده در سیکل بعد دوباره تلاش می‌شوند
+        self._entities: Dict[str, Channel] = {}
+        # InputPeer های resolve شده تا forward_messages هر بار آن‌ها را دوباره resolve نکند
+        self._dest_input = None
+        self._source_inputs: Dict[int, object] = {}
+        
         logger.info("🚀 UserBot مانیتورینگ راه‌اندازی شد")
     
     async def init_database(self):
         """راه‌اندازی دیتابیس SQLite"""
-        self.db_conn = await aiosqlite.connect(config.DATABASE_FILE)
+        self.db_conn = await aiosqlite.connect(config.DATABASE_FILE, cached_statements=256)
+        
+        # auto_vacuum باید پیش از ساخت جداول تنظیم شود؛ دیتابیس موجود یک بار VACUUM می‌شود
+        await self.enable_incremental_vacuum()
+        
+        # تنظیمات SQLite پیش از هر DDL تا همه نوشتن‌ها از مسیر WAL بگذرند
+        await self.db_conn.execute('PRAGMA journal_mode=WAL')
+        await self.db_conn.execute('PRAGMA synchronous=NORMAL')
+        await self.db_conn.execute('PRAGMA temp_store=MEMORY')
+        await self.db_conn.execute('PRAGMA cache_size=-20000')
+        await self.db_conn.execute('PRAGMA busy_timeout=5000')
+        await self.db_conn.execute('PRAGMA mmap_size=134217728')
+        
+        # ساخت جداول و مهاجرت در یک تراکنش
+        await self.db_conn.execute('BEGIN')
+        
+        # جدول قدیمی با UNIQUE(message_id, channel_id) بازسازی می‌شود
+        legacy = await self._rename_legacy_sent_messages()
         
         # ایجاد جدول برای پیام‌های ارسال شده
+        # ایندکس خودکار UNIQUE(channel_id, message_id) مسیر جستجوی هر کانال را پوشش می‌دهد
         await self.db_conn.execute('''
             CREATE TABLE IF NOT EXISTS sent_messages (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -62,10 +134,20 @@ class TelegramChannelMonitor:
                 file_name TEXT NOT NULL,
                 file_size INTEGER,
                 sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(message_id, channel_id)
+                UNIQUE(channel_id, message_id)
             )
         ''')
         
+        if legacy:
+            await self.db_conn.execute('''
+                INSERT INTO sent_messages 
+                (id, message_id, channel_id, channel_username, file_name, file_size, sent_at)
+                SELECT id, message_id, channel_id, channel_username, file_name, file_size, sent_at
+                FROM sent_messages_old
+            ''')
+            await self.db_conn.execute('DROP TABLE sent_messages_old')
+            logger.info("🔄 جدول sent_messages به ساختار جدید منتقل شد")
+        
         # ایجاد جدول برای لاگ فعالیت‌ها
         await self.db_conn.execute('''
             CREATE TABLE IF NOT EXISTS activity_log (
@@ -76,59 +158,196 @@ class TelegramChannelMonitor:
             )
         ''')
         
-        # ایجاد ایندکس برای بهبود عملکرد
+        # آمار تجمیعی در یک ردیف تا نمایش آمار نیاز به پیمایش کل جدول نداشته باشد
         await self.db_conn.execute('''
-            CREATE INDEX IF NOT EXISTS idx_sent_messages 
-            ON sent_messages(message_id, channel_id)
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total_files INTEGER DEFAULT 0,
+                total_size INTEGER DEFAULT 0
+            )
         ''')
         
+        # مقداردهی اولیه از داده‌های موجود (فقط بار اول)
+        # تابع تجمیعی همیشه یک ردیف برمی‌گرداند؛ OR IGNORE از درج دوباره جلوگیری می‌کند
+        await self.db_conn.execute('''
+            INSERT OR IGNORE INTO stats_counters (id, total_files, total_size)
+            SELECT 1, COUNT(*), COALESCE(SUM(file_size), 0) FROM sent_messages
+            WHERE NOT EXISTS (SELECT 1 FROM stats_counters)
+        ''')
+        
+        # ایندکس تکراری نسخه‌های قبلی (همان ستون‌های UNIQUE)
+        await self.db_conn.execute('DROP INDEX IF EXISTS idx_sent_messages')
+        
         await self.db_conn.commit()
+        
+        # اتصال فقط‌خواندنی جدا تا خواندن‌ها پشت نوشتن‌ها منتظر نمانند
+        self.db_reader = await aiosqlite.connect(
+            Path(config.DATABASE_FILE).resolve().as_uri() + '?mode=ro',
+            uri=True,
+            cached_statements=256
+        )
+        # ردیف‌ها به صورت tuple ساده برگردانده می‌شوند
+        self.db_reader.row_factory = None
+        await self.db_reader.execute('PRAGMA temp_store=MEMORY')
+        await self.db_reader.execute('PRAGMA cache_size=-20000')
+        await self.db_reader.execute('PRAGMA busy_timeout=5000')
+        await self.db_reader.execute('PRAGMA mmap_size=134217728')
+        
         logger.info("✅ دیتابیس راه‌اندازی شد")
     
-    async def log_activity(self, action: str, details: str = ""):
-        """ثبت فعالیت در دیتابیس"""
-        if self.db_conn:
+    async def enable_incremental_vacuum(self):
+        """فعال‌سازی auto_vacuum=INCREMENTAL"""
+        rows = await self.db_conn.execute_fetchall('PRAGMA auto_vacuum')
+        if rows and rows[0][0] == 2:  # INCREMENTAL
+            return
+        
+        await self.db_conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        
+        rows = await self.db_conn.execute_fetchall(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' LIMIT 1"
+        )
+        if rows:
+            logger.info("🧹 تبدیل دیتابیس موجود به auto_vacuum افزایشی (VACUUM)...")
+            await self.db_conn.execute('VACUUM')
+    
+    async def run_maintenance(self):
+        """حذف لاگ‌های قدیمی، آزادسازی صفحات خالی و کوتاه کردن WAL"""
+        async with self._tx_lock:
             await self.db_conn.execute(
-                'INSERT INTO activity_log (action, details) VALUES (?, ?)',
-                (action, details)
+                "DELETE FROM activity_log WHERE created_at < datetime('now', ?)",
+                (f'-{ACTIVITY_LOG_RETENTION_DAYS} days',)
             )
             await self.db_conn.commit()
+            
+            # هر گام incremental_vacuum یک صفحه آزاد می‌کند؛ executescript آن را تا انتها اجرا می‌کند
+            await self.db_conn.executescript('PRAGMA incremental_vacuum(1000);')
+            await self.db_conn.execute_fetchall('PRAGMA wal_checkpoint(TRUNCATE)')
+        
+        logger.info("🧹 نگهداری دیتابیس انجام شد")
+    
+    async def _rename_legacy_sent_messages(self) -> bool:
+        """تغییر نام جدول قدیمی sent_messages برای بازسازی با ترتیب جدید UNIQUE"""
+        cursor = await self.db_conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'sent_messages'"
+        )
+        row = await cursor.fetchone()
+        await cursor.close()
+        
+        if not row or 'UNIQUE(message_id, channel_id)' not in row[0]:
+            return False
+        
+        await self.db_conn.execute('DROP INDEX IF EXISTS idx_sent_messages')
+        await self.db_conn.execute('ALTER TABLE sent_messages RENAME TO sent_messages_old')
+        return True
+    
+    async def begin_transaction(self):
+        """شروع تراکنش نوشتن برای کل سیکل"""
+        async with self._tx_lock:
+            # نوشتن‌های خارج از سیکل ابتدا ثبت می‌شوند
+            if self.db_conn.in_transaction:
+                await self.db_conn.commit()
+            await self.db_conn.execute('BEGIN IMMEDIATE')
+            self._pending_writes = 0
+            self._in_cycle = True
+    
+    async def end_transaction(self):
+        """ثبت تراکنش سیکل"""
+        async with self._tx_lock:
+            self._in_cycle = False
+            await self.db_conn.commit()
+    
+    async def _count_write(self):
+        """شمارش نوشتن‌ها و commit ایمنی در سیکل‌های طولانی"""
+        self._pending_writes += 1
+        if self._pending_writes >= SAFETY_COMMIT_EVERY:
+            # فقط commit؛ با بررسی همزمان کانال‌ها نوشتن بعدی خودش تراکنش باز می‌کند
+            await self.db_conn.commit()
+            self._pending_writes = 0
+    
+    def log_activity(self, action: str, details: str = ""):
+        """ثبت فعالیت در صف لاگ (بدون انتظار برای دیتابیس)"""
+        try:
+            self._log_queue.put_nowait((action, details))
+        except asyncio.QueueFull:
+            self._dropped_logs += 1
+    
+    async def _write_logs(self, batch: List[tuple]):
+        """نوشتن یک دسته لاگ با یک executemany و یک commit"""
+        async with self._tx_lock:
+            await self.db_conn.executemany(SQL_INSERT_LOG, batch)
+            # در طول سیکل لاگ‌ها همراه تراکنش سیکل ثبت می‌شوند
+            if not self._in_cycle:
+                await self.db_conn.commit()
+    
+    def _drain_log_queue(self) -> List[tuple]:
+        """برداشتن لاگ‌های موجود در صف تا سقف یک دسته"""
+        batch = []
+        while len(batch) < LOG_BATCH_SIZE and not self._log_queue.empty():
+            batch.append(self._log_queue.get_nowait())
+        return batch
+    
+    async def _log_writer(self):
+        """نویسنده پس‌زمینه لاگ فعالیت‌ها؛ با دریافت None پس از نوشتن دسته جاری متوقف می‌شود"""
+        while True:
+            batch = [await self._log_queue.get()]
+            batch += self._drain_log_queue()
+            stop = None in batch
+            batch = [entry for entry in batch if entry is not None]
+            if batch:
+                try:
+                    await self._write_logs(batch)
+                except Exception as e:
+                    logger.warning(f"⚠️  خطا در ثبت لاگ فعالیت‌ها: {e}")
+            if stop:
+                break
     
     async def is_message_processed(self, message_id: int, channel_id: int) -> bool:
         """بررسی آیا پیام قبلاً پردازش شده است"""
-        if not self.db_conn:
+        if not self.db_reader:
             return False
         
-        cursor = await self.db_conn.execute(
-            'SELECT 1 FROM sent_messages WHERE message_id = ? AND channel_id = ?',
-            (message_id, channel_id)
+        rows = await self.db_reader.execute_fetchall(SQL_IS_PROCESSED, (channel_id, message_id))
+        return bool(rows)
+    
+    async def get_processed_ids(self, channel_id: int, message_ids: List[int]) -> Set[int]:
+        """دریافت شناسه پیام‌های پردازش شده یک کانال با یک کوئری"""
+        if not self.db_reader or not message_ids:
+            return set()
+        
+        placeholders = ','.join('?' * len(message_ids))
+        # اجرا و دریافت در یک رفت‌وبرگشت به نخ aiosqlite
+        rows = await self.db_reader.execute_fetchall(
+            f'SELECT message_id FROM sent_messages '
+            f'WHERE channel_id = ? AND message_id IN ({placeholders})',
+            (channel_id, *message_ids)
         )
-        result = await cursor.fetchone()
-        await cursor.close()
         
-        return result is not None
+        return {row[0] for row in rows}
     
     async def mark_message_as_sent(self, message: Message, channel: Channel, filename: str):
         """علامت‌گذاری پیام به عنوان ارسال شده"""
         if not self.db_conn:
             return
         
-        file_size = message.media.document.size if hasattr(message.media.document, 'size') else 0
+        file_size = getattr(message.media.document, 'size', 0) or 0
+        channel_id = channel.id
+        username = getattr(channel, 'username', str(channel_id))
         
-        await self.db_conn.execute('''
-            INSERT OR IGNORE INTO sent_messages 
-            (message_id, channel_id, channel_username, file_name, file_size)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
+        cursor = await self.db_conn.execute(SQL_MARK_SENT, (
             message.id,
-            channel.id,
-            getattr(channel, 'username', str(channel.id)),
+            channel_id,
+            username,
             filename,
             file_size
         ))
         
-        await self.db_conn.commit()
-        await self.log_activity("FILE_SENT", f"{filename} از {channel.id}")
+        # پیام تکراری (IGNORE شده) در آمار و لاگ شمرده نمی‌شود
+        if cursor.rowcount > 0:
+            await self.db_conn.execute(SQL_BUMP_STATS, (file_size,))
+            self.log_activity("FILE_SENT", f"{filename} از {channel_id}")
+        await cursor.close()
+        
+        await self._count_write()
     
     async def authenticate_user(self):
         """احراز هویت کاربر"""
@@ -149,7 +368,7 @@ class TelegramChannelMonitor:
                 await self.client.sign_in(config.PHONE_NUMBER, code)
                 
                 logger.info("✅ احراز هویت موفقیت‌آمیز بود")
-                await self.log_activity("AUTH_SUCCESS")
+                self.log_activity("AUTH_SUCCESS")
                 
             except Exception as e:
                 logger.error(f"❌ خطا در احراز هویت: {e}")
@@ -171,109 +390,143 @@ class TelegramChannelMonitor:
         """بررسی دسترسی به کانال‌ها"""
         logger.info("🔍 بررسی دسترسی به کانال‌ها...")
         
-        accessible_channels = []
-        
         for channel_username in self.source_channels:
-            try:
-                entity = await self.client.get_entity(channel_username)
-                
-                if hasattr(entity, 'title'):
-                    logger.info(f"✅ دسترسی به: {entity.title} (@{getattr(entity, 'username', 'private')})")
-                    accessible_channels.append(entity)
-                else:
-                    logger.warning(f"⚠️  موجودیت ناشناس: {channel_username}")
-                    
-            except ChannelPrivateError:
-                logger.error(f"❌ کانال {channel_username} خصوصی است. لطفاً عضو شوید.")
-            except ValueError as e:
-                logger.error(f"❌ کانال {channel_username} پیدا نشد: {e}")
-            except Exception as e:
-                logger.error(f"❌ خطا در دسترسی به {channel_username}: {e}")
+            await self._resolve_source(channel_username)
         
         # بررسی کانال مقصد
         try:
             dest_entity = await self.client.get_entity(self.destination_channel)
             logger.info(f"✅ دسترسی به کانال مقصد: {getattr(dest_entity, 'title', self.destination_channel)}")
+            self._dest_input = await self.client.get_input_entity(dest_entity)
         except Exception as e:
             logger.error(f"❌ خطا در دسترسی به کانال مقصد: {e}")
             raise
+    
+    async def _resolve_source(self, channel_username: str) -> Optional[Channel]:
+        """دریافت entity و InputPeer یک کانال مبدا؛ در صورت خطا در سیکل بعد دوباره تلاش می‌شود"""
+        try:
+            entity = await self.client.get_entity(channel_username)
+            
+            if not hasattr(entity, 'title'):
+                logger.warning(f"⚠️  موجودیت ناشناس: {channel_username}")
+                return None
+            
+            self._source_inputs[entity.id] = await self.client.get_input_entity(entity)
+            
+        except ChannelPrivateError:
+            logger.error(f"❌ کانال {channel_username} خصوصی است. لطفاً عضو شوید.")
+            return None
+        except ValueError as e:
+            logger.error(f"❌ کانال {channel_username} پیدا نشد: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"❌ خطا در دسترسی به {channel_username}: {e}")
+            return None
         
-        return accessible_channels
+        logger.info(f"✅ دسترسی به: {entity.title} (@{getattr(entity, 'username', 'private')})")
+        self._entities[channel_username] = entity
+        return entity
     
     def extract_filename(self, document: Document) -> Optional[str]:
         """استخراج نام فایل از داکیومنت"""
         for attr in document.attributes:
-            if isinstance(attr, DocumentAttributeFilename):
+            if attr.__class__ is _FN:
                 return attr.file_name
         return None
     
-    async def process_message(self, message: Message, channel: Channel) -> bool:
-        """پردازش یک پیام و بررسی فایل"""
+    def is_target_message(self, message: Message) -> Optional[str]:
+        """بررسی‌های ارزان حافظه‌ای؛ نام فایل را در صورت تطابق پسوند برمی‌گرداند"""
+        # بررسی وجود مدیا و نوع آن (None هم نمونه MessageMediaDocument نیست)
+        media = message.media
+        if not isinstance(media, MessageMediaDocument):
+            return None
+        
+        # استخراج نام فایل
+        filename = self.extract_filename(media.document)
+        if not filename:
+            return None
+        
+        # بررسی پسوند مورد نظر؛ فقط انتهای نام کوچک می‌شود نه کل آن
+        tail = filename[len(filename) - self._target_ext_len:]
+        if tail.lower() != self._target_ext:
+            return None
+        
+        return filename
+    
+    async def process_message(self, message: Message, channel: Channel,
+                              filename: str, processed_ids: Set[int]) -> bool:
+        """پردازش یک پیام هدف (فیلتر پسوند قبلاً در check_channel_messages انجام شده)"""
         try:
-            # بررسی وجود مدیا و نوع آن
-            if not message.media or not isinstance(message.media, MessageMediaDocument):
-                return False
-            
-            # بررسی قبلاً پردازش شده
-            if await self.is_message_processed(message.id, channel.id):
-                return False
-            
-            # استخراج نام فایل
-            document = message.media.document
-            filename = self.extract_filename(document)
-            
-            if not filename:
-                return False
-            
-            filename_lower = filename.lower()
-            
-            # بررسی پسوند مورد نظر
-            if not filename_lower.endswith(self.target_extension):
+            if message.id in processed_ids:
                 return False
             
             logger.info(f"🎯 فایل {self.target_extension} یافت شد: {filename}")
             
             # ارسال به کانال مقصد
-            await self.forward_message(message, channel, filename)
-            
-            return True
+            return await self.forward_message(message, channel, filename)
             
         except Exception as e:
             logger.error(f"❌ خطا در پردازش پیام {message.id}: {e}")
             return False
     
-    async def forward_message(self, message: Message, source_channel: Channel, filename: str):
+    async def forward_message(self, message: Message, source_channel: Channel, filename: str) -> bool:
         """ارسال پیام به کانال مقصد"""
         try:
-            # فوروارد پیام
-            await self.client.forward_messages(
-                entity=self.destination_channel,
-                messages=message.id,
-                from_peer=source_channel.id
-            )
+            # فوروارد پیام؛ فقط همین درخواست در صورت FloodWait تکرار می‌شود
+            for attempt in range(1, config.MAX_SEND_RETRIES + 1):
+                try:
+                    await self._forward_bucket.acquire()
+                    await self.client.forward_messages(
+                        entity=self._dest_input or self.destination_channel,
+                        messages=message.id,
+                        from_peer=self._source_inputs.get(source_channel.id, source_channel)
+                    )
+                    self._forward_bucket.reward()
+                    break
+                except FloodWaitError as e:
+                    if attempt == config.MAX_SEND_RETRIES:
+                        raise
+                    # انتظار درخواستی سرور، با حداقل رو به رشد (حداکثر 60 ثانیه)
+                    delay = max(e.seconds, min(2 ** attempt, 60))
+                    logger.warning(
+                        f"⏳ محدودیت FloodWait. انتظار {delay} ثانیه... "
+                        f"(تلاش {attempt}/{config.MAX_SEND_RETRIES})"
+                    )
+                    # کاهش نرخ؛ فوروارد بعدی (از هر کانالی) تا پایان انتظار صبر می‌کند
+                    self._forward_bucket.throttle(delay)
             
             logger.info(f"📤 فایل {filename} ارسال شد")
             
-            # ذخیره در دیتابیس
+            # ذخیره در دیتابیس (فقط یک بار پس از موفقیت)
             await self.mark_message_as_sent(message, source_channel, filename)
             
-            await self.log_activity("FORWARD_SUCCESS", filename)
+            self.log_activity("FORWARD_SUCCESS", filename)
+            
+            return True
             
         except FloodWaitError as e:
-            logger.warning(f"⏳ محدودیت FloodWait. انتظار {e.seconds} ثانیه...")
-            await asyncio.sleep(e.seconds)
-            await self.forward_message(message, source_channel, filename)
+            logger.error(f"❌ ارسال {filename} پس از {config.MAX_SEND_RETRIES} تلاش ناموفق بود: {e}")
+            return False
             
         except ChatAdminRequiredError:
             logger.error("❌ نیاز به دسترسی ادمین در کانال مقصد")
+            return False
             
         except Exception as e:
             logger.error(f"❌ خطا در ارسال فایل: {e}")
+            return False
     
-    async def check_channel_messages(self, channel_entity) -> int:
+    async def check_channel_messages(self, channel_username: str) -> int:
         """بررسی پیام‌های یک کانال"""
         sent_count = 0
         
+        # کانالی که در شروع یا سیکل‌های قبل دریافت نشده، دوباره تلاش می‌شود
+        channel_entity = self._entities.get(channel_username)
+        if channel_entity is None:
+            channel_entity = await self._resolve_source(channel_username)
+            if channel_entity is None:
+                return 0
+        
         try:
             logger.info(f"🔎 در حال بررسی کانال: {getattr(channel_entity, 'title', 'Unknown')}")
             
@@ -287,11 +540,21 @@ class TelegramChannelMonitor:
                 logger.info(f"📭 هیچ پیامی در کانال یافت نشد")
                 return 0
             
+            # پیام‌های پردازش شده با یک کوئری، فقط برای پیام‌های با پسوند هدف
+            is_target = self.is_target_message
+            targets = [(m, fn) for m in messages if (fn := is_target(m))]
+            if not targets:
+                return 0
+            
+            processed_ids = await self.get_processed_ids(
+                channel_entity.id, [m.id for m, _ in targets]
+            )
+            
             # پردازش پیام‌ها از جدید به قدیم
-            for message in messages:
-                if await self.process_message(message, channel_entity):
+            process = self.process_message
+            for message, filename in targets:
+                if await process(message, channel_entity, filename, processed_ids):
                     sent_count += 1
-                    await asyncio.sleep(1)  # وقفه بین ارسال‌ها
             
             return sent_count
             
@@ -307,50 +570,62 @@ class TelegramChannelMonitor:
             logger.error(f"❌ خطا در بررسی کانال: {e}")
             return 0
     
+    async def _guarded_check(self, semaphore: asyncio.Semaphore, channel_username: str) -> int:
+        """بررسی کانال در محدوده semaphore با کمی تأخیر تصادفی"""
+        async with semaphore:
+            # جلوگیری از ارسال همزمان درخواست‌ها
+            await asyncio.sleep(random.uniform(0, 1))
+            return await self.check_channel_messages(channel_username)
+    
     async def monitor_cycle(self):
         """یک سیکل کامل مانیتورینگ"""
+        # همه نوشتن‌های سیکل در یک تراکنش ثبت می‌شوند
+        await self.begin_transaction()
+        
         try:
             logger.info("=" * 50)
             logger.info("🔄 شروع سیکل مانیتورینگ")
             
-            # بررسی دسترسی به کانال‌ها
-            channels = await self.check_channel_access()
+            channels = self.source_channels
             
-            if not channels:
-                logger.warning("⚠️  هیچ کانال قابل دسترسی یافت نشد")
-                return
+            # بررسی همزمان کانال‌ها با محدودیت تعداد
+            semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_CHANNELS)
+            results = await asyncio.gather(
+                *(self._guarded_check(semaphore, channel) for channel in channels),
+                return_exceptions=True
+            )
             
             total_sent = 0
-            
-            # بررسی هر کانال
-            for channel in channels:
-                sent = await self.check_channel_messages(channel)
-                total_sent += sent
-                
-                # وقفه بین بررسی کانال‌ها
-                if channel != channels[-1]:
-                    await asyncio.sleep(2)
+            for channel, result in zip(channels, results):
+                if isinstance(result, BaseException):
+                    logger.error(f"❌ خطا در بررسی کانال {channel}: {result}")
+                else:
+                    total_sent += result
             
             logger.info(f"✅ سیکل کامل شد. {total_sent} فایل ارسال شد")
             logger.info("=" * 50)
             
-            await self.log_activity("CYCLE_COMPLETE", f"ارسال شده: {total_sent}")
+            self.log_activity("CYCLE_COMPLETE", f"ارسال شده: {total_sent}")
             
         except Exception as e:
             logger.error(f"❌ خطا در سیکل مانیتورینگ: {e}")
-            await self.log_activity("CYCLE_ERROR", str(e))
+            self.log_activity("CYCLE_ERROR", str(e))
+        finally:
+            await self.end_transaction()
     
     async def show_statistics(self):
         """نمایش آمار"""
-        if not self.db_conn:
+        if not self.db_reader:
             return
         
-        cursor = await self.db_conn.execute('''
+        # تعداد کانال‌ها فقط از ایندکس UNIQUE(channel_id, message_id) خوانده می‌شود
+        cursor = await self.db_reader.execute('''
             SELECT 
-                COUNT(*) as total_files,
-                COUNT(DISTINCT channel_id) as total_channels,
-                SUM(file_size) as total_size
-            FROM sent_messages
+                total_files,
+                (SELECT COUNT(DISTINCT channel_id) FROM sent_messages) as total_channels,
+                total_size
+            FROM stats_counters
+            WHERE id = 1
         ''')
         
         stats = await cursor.fetchone()
@@ -375,10 +650,14 @@ class TelegramChannelMonitor:
             
             # راه‌اندازی دیتابیس
             await self.init_database()
+            self._log_task = asyncio.create_task(self._log_writer())
             
             # احراز هویت
             await self.authenticate_user()
             
+            # بررسی دسترسی به کانال‌ها (کانال‌های ناموفق در سیکل‌های بعد دوباره تلاش می‌شوند)
+            await self.check_channel_access()
+            
             logger.info(f"⏱️  فاصله بررسی: هر {self.check_interval} ثانیه")
             logger.info(f"📨 بررسی {self.messages_to_check} پیام آخر هر کانال")
             logger.info(f"🎯 جستجوی فایل‌های: *{self.target_extension}")
@@ -400,15 +679,25 @@ class TelegramChannelMonitor:
                 if cycle_count % 10 == 0:
                     await self.show_statistics()
                 
+                # نگهداری دوره‌ای دیتابیس
+                if cycle_count % MAINTENANCE_EVERY == 0:
+                    try:
+                        await self.run_maintenance()
+                    except Exception as e:
+                        logger.warning(f"⚠️  خطا در نگهداری دیتابیس: {e}")
+                
                 # انتظار برای سیکل بعدی
                 if self.is_running:
                     logger.info(f"⏳ انتظار {self.check_interval} ثانیه برای سیکل بعدی...")
                     
-                    # انتظار با قابلیت توقف
-                    for _ in range(self.check_interval):
-                        if not self.is_running:
-                            break
-                        await asyncio.sleep(1)
+                    # انتظار با قابلیت توقف (بدون بیدار شدن هر ثانیه)
+                    try:
+                        await asyncio.wait_for(
+                            self._stop_event.wait(),
+                            timeout=self.check_interval
+                        )
+                    except asyncio.TimeoutError:
+                        pass
             
         except KeyboardInterrupt:
             logger.info("\n🛑 دریافت سیگنال توقف...")
@@ -422,10 +711,27 @@ class TelegramChannelMonitor:
         """پاکسازی منابع"""
         self.is_running = False
         
+        if self._log_task:
+            # بدون cancel تا دسته‌ای که از صف برداشته شده از دست نرود
+            if not self._log_task.done():
+                await self._log_queue.put(None)
+            await self._log_task
+        
         if self.db_conn:
+            # ثبت لاگ‌های باقی‌مانده در صف
+            while not self._log_queue.empty():
+                await self._write_logs(self._drain_log_queue())
+            
+            if self._dropped_logs:
+                logger.warning(f"⚠️  {self._dropped_logs} لاگ فعالیت به دلیل پر بودن صف ثبت نشد")
+            
+            await self.db_conn.commit()
             await self.db_conn.close()
             logger.info("✅ دیتابیس بسته شد")
         
+        if self.db_reader:
+            await self.db_reader.close()
+        
         if self.client.is_connected():
             await self.client.disconnect()
             logger.info("✅ اتصال تلگرام بسته شد")
@@ -434,6 +740,7 @@ class TelegramChannelMonitor:
     
     def setup_signal_handlers(self):
         """تنظیم هندلرهای سیگنال"""
+        self._loop = asyncio.get_running_loop()
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
     
@@ -441,6 +748,8 @@ class TelegramChannelMonitor:
         """هندلر سیگنال‌های توقف"""
         logger.info(f"📡 دریافت سیگنال توقف ({signum})")
         self.is_running = False
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
 
 async def main():
     """تابع اصلی اجرا"""
@@ -458,6 +767,13 @@ if __name__ == "__main__":
         import io
         sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
         sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+    else:
+        # حلقه رویداد uvloop در صورت نصب بودن (روی ویندوز پشتیبانی نمی‌شود)
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        except ImportError:
+            pass
     
     # اجرای اصلی
     try: